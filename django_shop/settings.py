@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.middleware.CurrentUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -82,6 +83,23 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+CACHES = {
+    # 商品卡片和列表页的片段缓存、会话缓存，每个进程各自保存
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # 所有工作进程共享的缓存，用于保存商品目录版本（见 shop/caching.py ）
+    # 文件缓存只在同一台主机的进程间共享，多台主机部署时请改用 Redis 或 Memcached
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -119,6 +137,10 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+# collectstatic 时生成带内容哈希的文件名及 .gz/.br 预压缩文件，详见 shop/storage.py
+STATICFILES_STORAGE = 'shop.storage.CompressedManifestStaticFilesStorage'
 
 
 # Media files
@@ -126,8 +148,56 @@ STATIC_URL = '/static/'
 MEDIA_ROOT = 'media/'
 MEDIA_URL = '/media/'
 
+# 媒体文件的发送方式，详见 shop/serving.py
+#   None: 由 Django 发送
+#   'x-accel-redirect': 交给 nginx 发送，需配置 internal 的 SHOP_MEDIA_ACCEL_PREFIX 路径指向 MEDIA_ROOT
+#   'x-sendfile': 交给 Apache (mod_xsendfile) 或 lighttpd 发送
+SHOP_MEDIA_ACCEL = None
+SHOP_MEDIA_ACCEL_PREFIX = '/protected-media/'
+# 静态文件同样按 SHOP_MEDIA_ACCEL 发送，x-accel-redirect 时需配置 internal 的路径指向 STATIC_ROOT
+SHOP_STATIC_ACCEL_PREFIX = '/protected-static/'
+# 非 uuid 命名的媒体文件的缓存时间（秒）
+SHOP_MEDIA_MAX_AGE = 3600
+
+
+# Fragment caching
+# 商品列表页的两层片段缓存，详见 shop/caching.py
+
+SHOP_FRAGMENT_CACHE_TIMEOUT = 3600  # 片段缓存的过期时间（秒）
+SHOP_CATALOG_GENERATION_CACHE = 'shared'  # 保存目录版本的缓存，必须在所有工作进程之间共享
+
 
 # Session
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# 基于 cached_db ，内容没有变化的会话不会被重新写入，详见 shop/sessions.py
+SESSION_ENGINE = 'shop.sessions'
 SESSION_COOKIE_AGE = 604800   # 2 week
+
+
+# Password hashing
+# bcrypt 哈希在有界的执行器中计算，详见 shop/hashing.py
+
+SHOP_PASSWORD_HASHER = {
+    'EXECUTOR': 'thread',   # 'thread' 或 'process'
+    'WORKERS': 2,           # 同时计算哈希的最大数量
+    'MAX_PENDING': 0,       # 等待计算的最大任务数量，超出时立即拒绝（排队的请求同样占用请求线程）
+    'TIMEOUT': 2,           # 等待计算结果的最长时间（秒）
+}
+
+# bcrypt 的轮数，修改后已有用户的哈希在下次登陆时重新计算；使用 calibrate_bcrypt 命令测量合适的轮数
+SHOP_PASSWORD_ROUNDS = 12
+
+# 计算密码哈希之前的限流和并发控制，详见 shop/throttling.py
+SHOP_PASSWORD_THROTTLE = {
+    'IP_RATE': (30, 60),        # 每个 IP 每 60 秒 30 次
+    'USERNAME_RATE': (10, 60),  # 每个用户名每 60 秒 10 次
+    'CONCURRENCY': 8,           # 所有工作进程中同时计算哈希的最大数量
+    'LEASE_TIMEOUT': 30,        # 租约的有效时间（秒）
+}
+
+
+# Goods image variants
+# 商品图片上传后在后台线程中生成的缩略图，详见 shop/images.py
+
+SHOP_IMAGE_VARIANT_WIDTHS = (160, 320, 640)
+SHOP_IMAGE_WORKERS = 1
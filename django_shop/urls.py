@@ -14,14 +14,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.conf.urls import url
-from django.urls import path, include
-from django.views.static import serve
+from django.urls import path, re_path, include
 
-from . import settings
+from shop.serving import serve_media, serve_static
 
 urlpatterns = [
     path('shop/', include('shop.urls')),
     path('admin/', admin.site.urls),
-    url(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
+    re_path(r'^static/(?P<path>.*)$', serve_static),
 ]
@@ -3,3 +3,4 @@ from django.apps import AppConfig
 
 class ShopConfig(AppConfig):
     name = 'shop'
+    default_auto_field = 'django.db.models.AutoField'
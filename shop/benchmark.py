@@ -0,0 +1,244 @@
+"""进程内的负载与延迟基准测试
+
+使用 django.test.Client 在若干线程中并发请求 shop/urls.py 中的每个路由（访客和已登录用户），
+统计每个场景的吞吐量、p50/p95/p99 延迟和每个请求的查询次数，并可与保存的基准结果比较。
+由 bench 管理命令调用，见 shop/management/commands/bench.py 。
+"""
+
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, close_old_connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from . import caching, search, seeding
+from .models import User, Goods, SellerSummary, get_usertype_id
+
+
+# 生成用户的明文密码
+SEED_PASSWORD = 'bench-password'
+SEED_KEYWORD = '键盘'
+
+
+def client_password(password=SEED_PASSWORD):
+    return seeding.client_password(password)
+
+
+def seed(users=50, goods=500, rand=None):
+    """创建基准测试用的用户和商品，返回 (用户列表, 商品ID列表)"""
+
+    rand = rand or random.Random(0)
+    seeding.seed_users(users, SEED_PASSWORD, prefix='bench', rand=rand)
+    seeded_users = list(User.objects.filter(username__startswith='bench').order_by('pk'))
+    sellers = [u.pk for u in seeded_users if u.type_id == get_usertype_id('seller')] or [seeded_users[0].pk]
+    seeding.seed_goods(goods, sellers, rand=rand)
+
+    # bulk_create 不发送信号，需要重建检索索引和商家汇总数据
+    search.rebuild_index(Goods.objects.all())
+    SellerSummary.reconcile()
+    caching.bump_catalog_generation()
+    return seeded_users, list(Goods.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def login_client(user):
+    """创建已登录指定用户的客户端（直接写入会话，不计算密码哈希）"""
+
+    client = Client()
+    engine = import_string(settings.SESSION_ENGINE)
+    session = engine.SessionStore()
+    session['user_id'] = user.pk
+    session.create()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+    return client
+
+
+class Scenario:
+    """一个基准测试场景：以某种身份请求某个路由"""
+
+    def __init__(self, route, label, method='get', path=None, data=None, login=False, prepare=None):
+        self.route = route
+        self.label = label
+        self.method = method
+        self.path = path or reverse(f'shop:{route}')
+        self.data = data
+        self.login = login
+        # 每个请求之前执行（不计时），参数为 (client, user)，返回要使用的客户端
+        self.prepare = prepare
+
+    def request(self, client):
+        handler = getattr(client, self.method)
+        data = self.data() if callable(self.data) else self.data
+        response = handler(self.path, data or {})
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+def build_scenarios(users, goods_ids):
+    """为 shop/urls.py 中的每个路由生成场景"""
+
+    user = users[0]
+    goods_id = goods_ids[len(goods_ids) // 2]
+    seller_id = Goods.objects.values_list('seller_id', flat=True).get(pk=goods_id)
+    keyword = SEED_KEYWORD
+
+    def fresh_login(client, u):
+        return login_client(u)
+
+    def fresh_guest(client, u):
+        return Client()
+
+    email_update = {'_ext_method': 'update', 'curr_email': 'nobody@example.com', 'new_email': 'x@example.com'}
+
+    return [
+        Scenario('goods_list', 'goods_list'),
+        Scenario('goods_list', 'goods_list:search', data={'g': keyword}),
+        Scenario('goods_list', 'goods_list:seller', data={'s': seller_id}),
+        Scenario('goods_list', 'goods_list:price', data={'min_price': 100, 'max_price': 1000}),
+        Scenario('goods_list', 'goods_list:seller_price', data={'s': seller_id, 'sort': '-price'}),
+        Scenario('goods_list', 'goods_list:newest', data={'sort': 'newest'}),
+        Scenario('goods_list', 'goods_list:login', login=True),
+        Scenario('goods_detail', 'goods_detail', path=reverse('shop:goods_detail', args=[goods_id])),
+        Scenario('goods_detail', 'goods_detail:login', path=reverse('shop:goods_detail', args=[goods_id]),
+                 login=True),
+        Scenario('register', 'register'),
+        Scenario('login', 'login'),
+        Scenario('login', 'login:post', method='post', prepare=fresh_guest,
+                 data={'username': user.username, 'password': client_password()}),
+        Scenario('logout', 'logout:login', login=True, prepare=fresh_login),
+        Scenario('center', 'center:login', login=True),
+        Scenario('member_info', 'member_info:login', login=True),
+        Scenario('change_member_email', 'change_member_email:login', login=True),
+        Scenario('change_member_password', 'change_member_password:login', login=True),
+        Scenario('error_403', 'error_403'),
+        Scenario('api_unauthorized_error', 'api_unauthorized_error:login', login=True),
+        Scenario('api_server_error', 'api_server_error:login', login=True),
+        Scenario('api_goods', 'api_goods', data={'limit': 20}),
+        Scenario('api_goods', 'api_goods:search', data={'g': keyword, 'fields': 'id,goods_name,price'}),
+        Scenario('api_goods', 'api_goods:price', data={'max_price': 500, 'sort': '-price'}),
+        Scenario('api_batch', 'api_batch:login', method='post', login=True, data={
+            'operations': '[{"api": "%s", "_ext_method": "pull", "params": {"limit": 5}}, '
+                          '{"api": "%s", "_ext_method": "update", "params": {"curr_email": "nobody@example.com", '
+                          '"new_email": "x@example.com"}}]'
+                          % (reverse('shop:api_goods'), reverse('shop:api_user_email')),
+        }),
+        Scenario('api_user_email', 'api_user_email:login', method='post', login=True, data=email_update),
+        Scenario('api_user_password', 'api_user_password:login', method='post', login=True, data={
+            '_ext_method': 'update', 'curr_password': client_password(),
+            'new_password': client_password('a'), 'new_password_again': client_password('b'),
+        }),
+    ]
+
+
+def missing_routes(scenarios):
+    """shop/urls.py 中没有被任何场景覆盖的路由名称"""
+
+    from . import urls
+
+    covered = {s.route for s in scenarios}
+    return sorted(p.name for p in urls.urlpatterns if p.name and p.name not in covered)
+
+
+def percentile(values, percent):
+    """按最近秩法计算百分位数"""
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def run_scenario(scenario, users, requests=50, clients=4, warmup=2):
+    """执行一个场景，返回统计结果
+
+    clients 个线程各自使用一个客户端，共发送 requests 个请求。
+    """
+
+    per_client = [requests // clients + (1 if i < requests % clients else 0) for i in range(clients)]
+    latencies, query_counts, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker(index, count):
+        user = users[index % len(users)]
+        client = login_client(user) if scenario.login else Client()
+        for _ in range(warmup):
+            scenario.request(scenario.prepare(client, user) if scenario.prepare else client)
+
+        local_latencies, local_queries, local_errors = [], [], []
+        for _ in range(count):
+            current = scenario.prepare(client, user) if scenario.prepare else client
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                try:
+                    response = scenario.request(current)
+                    if response.status_code >= 500:
+                        local_errors.append(response.status_code)
+                except Exception as e:
+                    local_errors.append(repr(e))
+                local_latencies.append(time.perf_counter() - start)
+            local_queries.append(len(queries))
+
+        with lock:
+            latencies.extend(local_latencies)
+            query_counts.extend(local_queries)
+            errors.extend(local_errors)
+
+    def thread_main(index, count):
+        close_old_connections()
+        try:
+            worker(index, count)
+        finally:
+            close_old_connections()
+
+    start = time.perf_counter()
+    if clients == 1:
+        worker(0, per_client[0])
+    else:
+        threads = [threading.Thread(target=thread_main, args=(i, n)) for i, n in enumerate(per_client)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'queries': sum(query_counts) / len(query_counts) if query_counts else 0.0,
+        'max_queries': max(query_counts, default=0),
+    }
+
+
+def compare(results, baseline, threshold=20.0):
+    """与基准结果比较，返回 {场景: [退化说明, ...]}
+
+    p95 延迟增加或吞吐量下降超过 threshold 百分比，或平均查询次数增加，都视为退化。
+    """
+
+    regressions = {}
+    for label, result in results.items():
+        base = baseline.get(label)
+        if not base:
+            continue
+
+        problems = []
+        if base['p95_ms'] and result['p95_ms'] > base['p95_ms'] * (1 + threshold / 100):
+            problems.append(f'p95 {base["p95_ms"]:.1f}ms -> {result["p95_ms"]:.1f}ms')
+        if base['throughput'] and result['throughput'] < base['throughput'] * (1 - threshold / 100):
+            problems.append(f'throughput {base["throughput"]:.1f}/s -> {result["throughput"]:.1f}/s')
+        if result['queries'] > base['queries'] + 0.01:
+            problems.append(f'queries {base["queries"]:.2f} -> {result["queries"]:.2f}')
+        if problems:
+            regressions[label] = problems
+    return regressions
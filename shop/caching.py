@@ -0,0 +1,56 @@
+"""商品目录的片段缓存
+
+商品列表页使用两层片段缓存（俄罗斯套娃式缓存）：
+    - 外层缓存整个商品列表，键由过滤参数和“目录版本”组成。任意商品被修改或删除时目录版本加一，
+      所有列表页的外层缓存随之失效。
+    - 内层缓存每个商品的卡片，键由商品ID和商品的 version 组成。商品被修改时只有它自己的卡片失效，
+      外层缓存重建时仍可复用其他商品的卡片。
+
+片段本身可以保存在每个进程各自的缓存中，但目录版本必须保存在所有工作进程共享的缓存中
+（settings.SHOP_CATALOG_GENERATION_CACHE ），否则修改商品后其他进程仍会返回旧的列表页。
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# 目录版本的缓存键
+CATALOG_GENERATION_KEY = 'shop:catalog_generation'
+
+
+def get_fragment_timeout():
+    """片段缓存的过期时间（秒）"""
+
+    return getattr(settings, 'SHOP_FRAGMENT_CACHE_TIMEOUT', 3600)
+
+
+def _generation_cache():
+    return caches[getattr(settings, 'SHOP_CATALOG_GENERATION_CACHE', 'default')]
+
+
+def _initial_generation():
+    # 以当前时间作为初始值，缓存被清空后也不会与旧的版本号重复
+    return int(time.time() * 1000)
+
+
+def get_catalog_generation():
+    """获取当前的目录版本"""
+
+    cache = _generation_cache()
+    generation = cache.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        cache.add(CATALOG_GENERATION_KEY, _initial_generation(), None)
+        generation = cache.get(CATALOG_GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    """目录版本加一，使所有商品列表的外层缓存失效"""
+
+    cache = _generation_cache()
+    try:
+        cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        cache.add(CATALOG_GENERATION_KEY, _initial_generation(), None)
@@ -0,0 +1,183 @@
+"""密码哈希服务
+
+bcrypt 每次计算约需数百毫秒 CPU 时间，若在请求线程中直接计算，登陆高峰时所有工作线程都会被占满。
+此服务将哈希计算交给一个固定大小的线程池（或进程池）执行，并限制排队任务的数量：
+同一时刻最多只有 WORKERS 个哈希在计算，超出 WORKERS + MAX_PENDING 的请求立即失败，
+从而为浏览商品等其他请求保留 CPU。
+
+注意：请求线程仍会同步等待计算结果（最长 TIMEOUT 秒），等待期间该线程不能处理其他请求。
+因此默认不排队（MAX_PENDING 为 0），TIMEOUT 只略长于一次计算：被密码请求占用的请求线程
+不超过 WORKERS 个，其余密码请求立即得到“服务器繁忙”的响应，而不是占用线程排队等待。
+
+bcrypt 在计算时会释放 GIL，因此默认使用线程池即可并行计算。
+"""
+
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+from django.conf import settings
+
+
+# 默认配置，可在 settings.SHOP_PASSWORD_HASHER 中覆盖
+DEFAULTS = {
+    # 执行器类型：'thread' 或 'process'
+    'EXECUTOR': 'thread',
+    # 同时计算哈希的最大数量
+    'WORKERS': 2,
+    # 等待计算的最大任务数量，超出时立即拒绝；排队的任务同样占用一个请求线程
+    'MAX_PENDING': 0,
+    # 等待计算结果的最长时间（秒）
+    'TIMEOUT': 2,
+}
+
+
+class PasswordHasherBusy(Exception):
+    """密码哈希服务繁忙：等待队列已满或等待超时"""
+
+
+def _hashpw(password, rounds, prefix):
+    salt = bcrypt.gensalt(rounds=rounds, prefix=prefix)
+    return bcrypt.hashpw(password=password, salt=salt)
+
+
+def hashpw(password, rounds, prefix):
+    """直接计算密码的 bcrypt 哈希（不经过执行器），返回字符串
+
+    供批量导入等离线任务在自己的进程池中调用。
+    """
+
+    return _hashpw(password.encode('utf-8'), rounds, prefix).decode('utf-8')
+
+
+def _checkpw(password, hashed_password):
+    return bcrypt.checkpw(password=password, hashed_password=hashed_password)
+
+
+BCRYPT_HASH_RE = re.compile(r'^\$(?P<prefix>2[abxy]?)\$(?P<rounds>\d{2})\$')
+
+
+def parse_hash(hashed_password):
+    """解析 bcrypt 哈希，返回 (前缀, 轮数)；格式错误时返回 (None, None)"""
+
+    match = BCRYPT_HASH_RE.match(hashed_password or '')
+    if match is None:
+        return None, None
+    return match['prefix'].encode('ascii'), int(match['rounds'])
+
+
+def needs_rehash(hashed_password, rounds, prefix):
+    """哈希的轮数或前缀与配置不同时需要重新计算"""
+
+    return parse_hash(hashed_password) != (prefix, rounds)
+
+
+def measure(rounds, samples=3, prefix=b'2b'):
+    """测量在本机计算指定轮数的哈希所需的时间（秒），取中位数"""
+
+    salt = bcrypt.gensalt(rounds=rounds, prefix=prefix)
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', salt)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+class PasswordHasher:
+    """有界的密码哈希执行器"""
+
+    def __init__(self, executor='thread', workers=2, max_pending=16, timeout=10):
+        if executor not in ('thread', 'process'):
+            raise ValueError('parameter "executor" must be "thread" or "process"')
+
+        self.executor_type = executor
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # 延迟创建执行器，避免在 fork 之前创建进程或线程
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    executor_class = ThreadPoolExecutor if self.executor_type == 'thread' else ProcessPoolExecutor
+                    self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, fn, *args):
+        """提交任务，队列已满时抛出 PasswordHasherBusy"""
+
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy('Too many pending password hashing tasks.')
+
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PasswordHasherBusy('Password hashing timed out.')
+
+    def hash(self, password, rounds, prefix):
+        """计算密码的 bcrypt 哈希，返回字符串"""
+
+        future = self.submit(_hashpw, password.encode('utf-8'), rounds, prefix)
+        return self._result(future).decode('utf-8')
+
+    def check(self, password, hashed_password):
+        """验证密码与哈希是否匹配，哈希格式错误时抛出 ValueError"""
+
+        future = self.submit(_checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+        return self._result(future)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+# 执行后台任务（如登陆后重新计算哈希）的线程池
+_background_executor = None
+
+
+def get_hasher():
+    """获取进程内共享的密码哈希服务"""
+
+    global _hasher
+
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                options = dict(DEFAULTS, **getattr(settings, 'SHOP_PASSWORD_HASHER', {}))
+                _hasher = PasswordHasher(executor=options['EXECUTOR'], workers=options['WORKERS'],
+                                         max_pending=options['MAX_PENDING'], timeout=options['TIMEOUT'])
+    return _hasher
+
+
+def submit_background(fn, *args):
+    """在后台线程中执行任务，不等待结果"""
+
+    global _background_executor
+
+    if _background_executor is None:
+        with _hasher_lock:
+            if _background_executor is None:
+                _background_executor = ThreadPoolExecutor(max_workers=1)
+    return _background_executor.submit(fn, *args)
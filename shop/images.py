@@ -0,0 +1,149 @@
+"""商品图片的缩略图
+
+商品图片上传后，在后台线程中使用 Pillow 生成若干固定宽度的 JPEG 和 WebP 缩略图，
+并记录到 GoodsImageVariant 。模板通过 srcset 和 <picture> 让浏览器选择合适的图片。
+"""
+
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# 缩略图的格式及其保存参数
+VARIANT_FORMATS = {
+    'jpeg': {'ext': 'jpg', 'options': {'quality': 85, 'optimize': True, 'progressive': True}},
+    'webp': {'ext': 'webp', 'options': {'quality': 80, 'method': 4}},
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_widths():
+    """缩略图的宽度（像素）"""
+
+    return tuple(getattr(settings, 'SHOP_IMAGE_VARIANT_WIDTHS', (160, 320, 640)))
+
+
+def variant_path(image_name, width, image_format):
+    """生成缩略图的路径，与原图位于同一目录下的 variants 目录中"""
+
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return f'{directory}/variants/{stem}_{width}.{VARIANT_FORMATS[image_format]["ext"]}'
+
+
+def _render_variant(image, width, image_format):
+    variant = image.copy()
+    variant.thumbnail((width, variant.height), Image.LANCZOS)
+
+    if image_format == 'jpeg' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    elif image_format == 'webp' and variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert('RGBA')
+
+    buffer = BytesIO()
+    variant.save(buffer, format=image_format.upper(), **VARIANT_FORMATS[image_format]['options'])
+    return variant.width, buffer.getvalue()
+
+
+def delete_image_variants(goods_id):
+    """删除商品的所有缩略图（包括文件）"""
+
+    from .models import GoodsImageVariant
+
+    variants = list(GoodsImageVariant.objects.filter(goods_id=goods_id))
+    for variant in variants:
+        variant.image.delete(save=False)
+    GoodsImageVariant.objects.filter(pk__in=[v.pk for v in variants]).delete()
+
+
+def delete_variant_files(names):
+    """删除缩略图文件（数据库中的记录已随商品删除）"""
+
+    from .models import GoodsImageVariant
+
+    storage = GoodsImageVariant._meta.get_field('image').storage
+    for name in names:
+        storage.delete(name)
+
+
+def generate_image_variants(goods_id):
+    """为商品图片生成缩略图，返回生成的缩略图数量"""
+
+    from .models import Goods, GoodsImageVariant
+    from . import caching
+
+    goods = Goods.objects.only('image').filter(pk=goods_id).first()
+    if goods is None or not goods.image:
+        return 0
+
+    image_name = goods.image.name
+    storage = goods.image.storage
+    with storage.open(image_name) as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+
+    # 不放大图片：只生成比原图窄的缩略图，原图比所有宽度都窄时按原宽度生成一份
+    widths = [w for w in get_variant_widths() if w < image.width] or [image.width]
+
+    variants = []
+    for width in widths:
+        for image_format in VARIANT_FORMATS:
+            actual_width, content = _render_variant(image, width, image_format)
+            name = storage.save(variant_path(image_name, width, image_format), ContentFile(content))
+            variants.append(GoodsImageVariant(goods_id=goods_id, width=actual_width, format=image_format, image=name))
+
+    with transaction.atomic():
+        # 缩略图改变了商品的展示内容，更新商品版本使缓存失效（图片已被替换时放弃本次结果）
+        updated = Goods.objects \
+            .filter(pk=goods_id, image=image_name) \
+            .update(version=uuid.uuid4(), updated_at=timezone.now())
+        if updated:
+            delete_image_variants(goods_id)
+            GoodsImageVariant.objects.bulk_create(variants)
+
+    if not updated:
+        for variant in variants:
+            storage.delete(variant.image.name)
+        return 0
+
+    caching.bump_catalog_generation()
+    return len(variants)
+
+
+def _run_in_background(goods_id):
+    close_old_connections()
+    try:
+        generate_image_variants(goods_id)
+    except Exception:
+        logger.exception('Failed to generate image variants for goods %s', goods_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'SHOP_IMAGE_WORKERS', 1))
+    return _executor
+
+
+def schedule_image_variants(goods_id):
+    """在当前事务提交后，于后台线程中生成缩略图"""
+
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_background, goods_id))
@@ -0,0 +1,228 @@
+"""批量导入用户
+
+从 CSV 或 JSONL 文件中流式读取用户，按块处理：
+    1. 校验格式，并用一次查询检查整块的用户名和邮箱是否已被使用；
+    2. 在进程池中并行计算密码的 bcrypt 哈希；
+    3. 使用 bulk_create 在一个事务中插入整块用户；
+    4. 将已处理的行数写入检查点文件。
+中途失败后可从检查点继续导入。检查点之后重复处理的用户会因用户名已存在而被跳过，不会重复导入。
+"""
+
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+from django.db import transaction
+from django.db.utils import IntegrityError
+
+from .forms import RegisterBEForm
+from .hashing import hashpw
+from .models import User, get_usertype_id
+
+
+# 允许导入的用户类型
+IMPORT_USERTYPES = ('normal', 'seller')
+
+
+def read_records(path, file_format=None):
+    """逐行读取用户记录，生成 (行号, 记录)；无法解析的行记录为空字典"""
+
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+    if file_format not in ('csv', 'jsonl'):
+        raise ValueError(f'unknown file format "{file_format}"')
+
+    with open(path, encoding='utf-8', newline='') as f:
+        if file_format == 'csv':
+            yield from enumerate(csv.DictReader(f), start=2)
+            return
+
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else {}
+
+
+class UserImporter:
+    """用户导入器
+
+    Parameters
+    ----------
+    path: 导入文件的路径。
+
+    file_format: 'csv' 或 'jsonl'，默认根据扩展名判断。文件中需包含 username 、email 、password 列，
+                 可选的 type 列为用户类型（normal 或 seller）。
+
+    password_format: 'plain' 表示明文密码；'sha256' 表示已经过客户端 SHA-256 处理的密码。
+
+    chunk_size: 每块处理的用户数量。
+
+    workers: 计算哈希的进程数量，默认为 CPU 数量。
+
+    checkpoint: 检查点文件的路径，默认为导入文件路径加 .checkpoint 。
+
+    rejects: 记录被拒绝的行的文件路径（JSONL），为 None 时不记录。
+
+    progress: 每处理完一块后以统计数据为参数调用。
+    """
+
+    def __init__(self, path, file_format=None, password_format='plain', chunk_size=1000, workers=None,
+                 checkpoint=None, rejects=None, progress=None):
+        if password_format not in ('plain', 'sha256'):
+            raise ValueError('parameter "password_format" must be "plain" or "sha256"')
+
+        self.path = path
+        self.file_format = file_format
+        self.password_format = password_format
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count()
+        self.checkpoint = checkpoint or f'{path}.checkpoint'
+        self.rejects = rejects
+        self.progress = progress
+
+        self.stats = {'processed': 0, 'imported': 0, 'rejected': 0}
+        self._seen_usernames = set()
+        self._seen_emails = set()
+        self._rejects_file = None
+
+    def load_checkpoint(self):
+        """读取与导入文件匹配的检查点，不存在或不匹配时返回 None"""
+
+        try:
+            with open(self.checkpoint, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('source') != os.path.abspath(self.path) or data.get('size') != os.path.getsize(self.path):
+            return None
+        return data
+
+    def save_checkpoint(self):
+        data = dict(self.stats, source=os.path.abspath(self.path), size=os.path.getsize(self.path))
+        temp_path = f'{self.checkpoint}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.checkpoint)
+
+    def run(self, resume=False):
+        """执行导入，返回统计数据；resume 为真时从检查点继续"""
+
+        checkpoint = self.load_checkpoint() if resume else None
+        if checkpoint:
+            self.stats.update({key: checkpoint[key] for key in self.stats})
+
+        records = islice(read_records(self.path, self.file_format), self.stats['processed'], None)
+        if self.rejects:
+            self._rejects_file = open(self.rejects, 'a' if checkpoint else 'w', encoding='utf-8')
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                while True:
+                    chunk = list(islice(records, self.chunk_size))
+                    if not chunk:
+                        break
+                    self.import_chunk(chunk, executor)
+                    self.save_checkpoint()
+                    if self.progress:
+                        self.progress(dict(self.stats))
+        finally:
+            if self._rejects_file:
+                self._rejects_file.close()
+
+        # 全部导入完成，删除检查点
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        return self.stats
+
+    def reject(self, line_number, reason):
+        self.stats['rejected'] += 1
+        if self._rejects_file:
+            self._rejects_file.write(json.dumps({'line': line_number, 'errors': reason}, ensure_ascii=False) + '\n')
+
+    def clean(self, record):
+        """校验单条记录，返回 (用户数据, 错误信息)"""
+
+        username = str(record.get('username') or '').strip()
+        email = str(record.get('email') or '').strip()
+        password = str(record.get('password') or '')
+        typename = str(record.get('type') or 'normal').strip()
+
+        if self.password_format == 'plain':
+            password = hashlib.sha256(password.encode('utf-8')).hexdigest() if password else ''
+        else:
+            password = password.lower()
+
+        if not RegisterBEForm({'username': username, 'email': email, 'password': password}).is_valid():
+            return None, 'Invalid format.'
+        if typename not in IMPORT_USERTYPES:
+            return None, 'Invalid user type.'
+        return {'username': username, 'email': email, 'password': password, 'type': typename}, None
+
+    def import_chunk(self, chunk, executor):
+        """处理一块记录"""
+
+        # 校验格式及文件内的重复
+        candidates = []
+        for line_number, record in chunk:
+            data, error = self.clean(record)
+            if error is None and data['username'] in self._seen_usernames:
+                error = 'Duplicate username in file.'
+            if error is None and data['email'].lower() in self._seen_emails:
+                error = 'Duplicate email in file.'
+            if error:
+                self.reject(line_number, error)
+                continue
+
+            self._seen_usernames.add(data['username'])
+            self._seen_emails.add(data['email'].lower())
+            candidates.append((line_number, data))
+
+        # 一次查询检查整块的用户名和邮箱是否已被使用
+        usernames = [data['username'] for _, data in candidates]
+        emails = [data['email'] for _, data in candidates]
+        used_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        used_emails = set(User.objects.filter_email(*emails).values_list('email_lower', flat=True))
+
+        valid = []
+        for line_number, data in candidates:
+            if data['username'] in used_usernames:
+                self.reject(line_number, 'Username already exists.')
+            elif data['email'].lower() in used_emails:
+                self.reject(line_number, 'Email already exists.')
+            else:
+                valid.append((line_number, data))
+
+        # 在进程池中并行计算哈希
+        passwords = [data['password'] for _, data in valid]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        hashed = executor.map(hashpw, passwords, repeat(User.SALT_ROUNDS), repeat(User.SALT_PREFIX),
+                              chunksize=chunksize)
+
+        users = [
+            (line_number, User(username=data['username'], email=data['email'], password=password,
+                               type_id=get_usertype_id(data['type'])))
+            for (line_number, data), password in zip(valid, hashed)
+        ]
+        self.insert(users)
+        self.stats['processed'] += len(chunk)
+
+    def insert(self, users):
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user for _, user in users])
+            self.stats['imported'] += len(users)
+        except IntegrityError:
+            # 与其他写入冲突时逐个插入，跳过冲突的用户
+            for line_number, user in users:
+                try:
+                    with transaction.atomic():
+                        User.objects.bulk_create([user])
+                    self.stats['imported'] += 1
+                except IntegrityError:
+                    self.reject(line_number, 'Username or email already exists.')
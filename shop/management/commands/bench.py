@@ -0,0 +1,117 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import setup_databases, teardown_databases, setup_test_environment, \
+    teardown_test_environment, override_settings
+
+from shop import benchmark
+
+
+class Command(BaseCommand):
+    help = '在测试数据库中生成数据，并发请求商城的每个路由，统计吞吐量、延迟和查询次数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='生成的用户数量')
+        parser.add_argument('--goods', type=int, default=500, help='生成的商品数量')
+        parser.add_argument('--requests', type=int, default=50, help='每个场景的请求数量')
+        parser.add_argument('--clients', type=int, default=4, help='并发的客户端数量')
+        parser.add_argument('--only', nargs='*', default=None, help='只执行指定的场景（场景名称或路由名称）')
+        parser.add_argument('--baseline', help='与指定的基准结果（JSON 文件）比较')
+        parser.add_argument('--save', help='将本次结果保存为基准结果（JSON 文件）')
+        parser.add_argument('--threshold', type=float, default=20.0, help='视为性能退化的变化幅度（百分比）')
+        parser.add_argument('--fail-on-regression', action='store_true', help='存在性能退化时以错误退出')
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['requests'] < 1:
+            raise CommandError('--clients 和 --requests 必须大于 0')
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+
+        # 使用独立的测试数据库，不影响现有数据
+        temp_dir = self.use_file_test_databases()
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # 同一客户端反复登陆会触发限流，测试时只保留并发数量的限制
+            throttle = dict(getattr(settings, 'SHOP_PASSWORD_THROTTLE', {}), IP_RATE=None, USERNAME_RATE=None)
+            # 不要求事先执行 collectstatic
+            storage = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+            with override_settings(SHOP_PASSWORD_THROTTLE=throttle, STATICFILES_STORAGE=storage):
+                results = self.run_benchmark(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump({'meta': self.get_meta(options), 'results': results}, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'结果已保存到 {options["save"]}')
+
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['threshold'])
+            for label, problems in regressions.items():
+                self.stdout.write(self.style.ERROR(f'{label}: {"; ".join(problems)}'))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('与基准结果相比没有性能退化。'))
+            elif options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} 个场景存在性能退化')
+
+    def use_file_test_databases(self):
+        """SQLite 的测试数据库默认在内存中（共享缓存），多个线程同时写入时会报“database table is locked”，
+        并非商城本身的错误。此处改为临时目录中的数据库文件，返回该目录；没有 SQLite 数据库时返回 None 。
+        """
+
+        temp_dir = None
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            if settings_dict['ENGINE'].endswith('sqlite3') and not settings_dict['TEST'].get('NAME'):
+                temp_dir = temp_dir or tempfile.mkdtemp(prefix='shop-bench-')
+                settings_dict['TEST']['NAME'] = os.path.join(temp_dir, f'{alias}.sqlite3')
+        return temp_dir
+
+    def run_benchmark(self, options):
+        start = time.perf_counter()
+        users, goods_ids = benchmark.seed(options['users'], options['goods'])
+        self.stdout.write(f'已生成 {len(users)} 个用户、{len(goods_ids)} 个商品（{time.perf_counter() - start:.1f}s）')
+
+        scenarios = benchmark.build_scenarios(users, goods_ids)
+        for route in benchmark.missing_routes(scenarios):
+            self.stderr.write(f'路由 {route} 没有对应的场景')
+        if options['only']:
+            scenarios = [s for s in scenarios if s.label in options['only'] or s.route in options['only']]
+
+        header = f'{"scenario":<34}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"errors":>8}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        results = {}
+        for scenario in scenarios:
+            result = benchmark.run_scenario(scenario, users, options['requests'], options['clients'])
+            results[scenario.label] = result
+            line = f'{scenario.label:<34}{result["throughput"]:>9.1f}{result["p50_ms"]:>9.2f}' \
+                   f'{result["p95_ms"]:>9.2f}{result["p99_ms"]:>9.2f}{result["queries"]:>9.2f}{result["errors"]:>8}'
+            self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
+
+        return results
+
+    def get_meta(self, options):
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'users': options['users'],
+            'goods': options['goods'],
+            'requests': options['requests'],
+            'clients': options['clients'],
+        }
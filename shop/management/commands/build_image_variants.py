@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from shop import images
+from shop.models import Goods
+
+
+class Command(BaseCommand):
+    help = '为商品图片生成缩略图'
+
+    def add_arguments(self, parser):
+        parser.add_argument('goods_ids', nargs='*', type=int, help='商品ID，不指定时处理所有缺少缩略图的商品')
+        parser.add_argument('--all', action='store_true', help='重新生成所有商品的缩略图')
+
+    def handle(self, *args, **options):
+        queryset = Goods.objects.exclude(image='').exclude(image__isnull=True)
+        if options['goods_ids']:
+            queryset = queryset.filter(pk__in=options['goods_ids'])
+        elif not options['all']:
+            queryset = queryset.filter(image_variants__isnull=True)
+
+        total = 0
+        for goods_id in queryset.values_list('pk', flat=True).order_by('pk').iterator():
+            try:
+                count = images.generate_image_variants(goods_id)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f'商品 {goods_id} 的图片处理失败：{e}')
+                continue
+            total += count
+            self.stdout.write(f'商品 {goods_id}：生成 {count} 张缩略图')
+
+        self.stdout.write(self.style.SUCCESS(f'共生成 {total} 张缩略图。'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import hashing
+from shop.models import User
+
+
+class Command(BaseCommand):
+    help = '测量本机计算 bcrypt 哈希所需的时间，并根据目标登陆延迟推荐轮数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250, help='计算一次哈希的目标时间（毫秒）')
+        parser.add_argument('--min-rounds', type=int, default=10, help='测量的最小轮数')
+        parser.add_argument('--max-rounds', type=int, default=16, help='测量的最大轮数')
+        parser.add_argument('--samples', type=int, default=3, help='每个轮数测量的次数')
+
+    def handle(self, *args, **options):
+        min_rounds, max_rounds = options['min_rounds'], options['max_rounds']
+        if not 4 <= min_rounds <= max_rounds <= 31:
+            raise CommandError('轮数必须满足 4 <= --min-rounds <= --max-rounds <= 31')
+        if options['samples'] < 1:
+            raise CommandError('--samples 必须大于 0')
+
+        target = options['target_ms'] / 1000
+        recommended = None
+        self.stdout.write(f'{"rounds":>6}{"ms":>10}{"hashes/s per core":>20}')
+        for rounds in range(min_rounds, max_rounds + 1):
+            duration = hashing.measure(rounds, options['samples'], User.SALT_PREFIX)
+            self.stdout.write(f'{rounds:>6}{duration * 1000:>10.1f}{1 / duration:>20.1f}')
+            if duration <= target:
+                recommended = rounds
+            else:
+                # 每增加一轮耗时翻倍，之后的轮数都超过目标时间
+                break
+
+        self.stdout.write(f'当前配置的轮数：{User.SALT_ROUNDS}')
+        if recommended is None:
+            self.stdout.write(self.style.WARNING(f'{min_rounds} 轮已超过目标时间，请降低 --min-rounds 或提高 --target-ms 。'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'推荐轮数：{recommended}（在 settings.SHOP_PASSWORD_ROUNDS 中设置，已有用户将在下次登陆时重新计算哈希）'))
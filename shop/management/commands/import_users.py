@@ -0,0 +1,45 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.importing import UserImporter
+
+
+class Command(BaseCommand):
+    help = '从 CSV 或 JSONL 文件批量导入用户'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='导入文件的路径，需包含 username 、email 、password 列，可选 type 列')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None, help='文件格式，默认根据扩展名判断')
+        parser.add_argument('--password-format', choices=['plain', 'sha256'], default='plain',
+                            help='密码格式：明文或客户端 SHA-256')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每块处理的用户数量')
+        parser.add_argument('--workers', type=int, default=None, help='计算密码哈希的进程数量，默认为 CPU 数量')
+        parser.add_argument('--checkpoint', default=None, help='检查点文件的路径，默认为导入文件路径加 .checkpoint')
+        parser.add_argument('--rejects', default=None, help='记录被拒绝的行的文件路径')
+        parser.add_argument('--resume', action='store_true', help='从检查点继续导入')
+
+    def handle(self, *args, **options):
+        if not os.path.isfile(options['path']):
+            raise CommandError(f'文件 {options["path"]} 不存在')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size 必须大于 0')
+
+        start = time.perf_counter()
+
+        def progress(stats):
+            rate = stats['processed'] / max(time.perf_counter() - start, 1e-6)
+            self.stdout.write(f'已处理 {stats["processed"]} 行，导入 {stats["imported"]} 个，'
+                              f'拒绝 {stats["rejected"]} 个（{rate:.0f} 行/秒）')
+
+        importer = UserImporter(options['path'], file_format=options['format'],
+                                password_format=options['password_format'], chunk_size=options['chunk_size'],
+                                workers=options['workers'], checkpoint=options['checkpoint'],
+                                rejects=options['rejects'], progress=progress)
+        if options['resume'] and importer.load_checkpoint():
+            self.stdout.write(f'从第 {importer.load_checkpoint()["processed"]} 行之后继续导入')
+
+        stats = importer.run(resume=options['resume'])
+        self.stdout.write(self.style.SUCCESS(
+            f'完成：导入 {stats["imported"]} 个用户，拒绝 {stats["rejected"]} 个，用时 {time.perf_counter() - start:.1f}s 。'))
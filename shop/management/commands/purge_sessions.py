@@ -0,0 +1,33 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import throttling
+from shop.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    help = '按批删除过期的会话，并删除空闲的限流令牌桶'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批删除的会话数量')
+        parser.add_argument('--sleep', type=float, default=0, help='每批删除后暂停的时间（秒），减少对线上请求的影响')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size 必须大于 0')
+
+        engine = import_module(settings.SESSION_ENGINE)
+        if not issubclass(engine.SessionStore, SessionStore):
+            raise CommandError(f'会话引擎 {settings.SESSION_ENGINE} 不支持按批删除，请使用 clearsessions 命令')
+
+        def progress(deleted):
+            self.stdout.write(f'已删除 {deleted} 个会话')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        deleted = engine.SessionStore.clear_expired(batch_size=options['batch_size'], progress=progress)
+        buckets = throttling.clear_idle_buckets()
+        self.stdout.write(self.style.SUCCESS(f'完成，共删除 {deleted} 个过期会话、{buckets} 个空闲的令牌桶。'))
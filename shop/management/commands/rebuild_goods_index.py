@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from shop import search, caching
+from shop.models import Goods
+
+
+class Command(BaseCommand):
+    help = '重建商品全文检索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='需要重建索引的数据库')
+        parser.add_argument('--batch-size', type=int, default=2000, help='每批写入索引的商品数量')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        count = search.rebuild_index(Goods.objects.using(using), using=using, batch_size=options['batch_size'])
+        caching.bump_catalog_generation()
+
+        if not search.is_available(using):
+            self.stderr.write('当前数据库不支持 FTS5 全文检索，未建立索引。')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'已重建 {count} 个商品的检索索引。'))
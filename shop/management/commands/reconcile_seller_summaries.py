@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import SellerSummary
+
+
+class Command(BaseCommand):
+    help = '按商品表校正商家的汇总数据（商品数量和价格区间）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的行数')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size 必须大于 0')
+
+        created, updated, deleted = SellerSummary.reconcile(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'已校正商家汇总数据：新建 {created} 个，更新 {updated} 个，删除 {deleted} 个。'))
@@ -0,0 +1,58 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import caching, search, seeding
+from shop.models import User, Goods, SellerSummary, get_usertype_id
+
+
+class Command(BaseCommand):
+    help = '批量生成测试用的用户和商品'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='生成的用户数量')
+        parser.add_argument('--goods', type=int, default=10000, help='生成的商品数量')
+        parser.add_argument('--password', default='12345678', help='所有生成用户的密码')
+        parser.add_argument('--prefix', default='seed', help='用户名的前缀')
+        parser.add_argument('--seller-ratio', type=float, default=0.2, help='生成的用户中商家的比例')
+        parser.add_argument('--images', type=int, default=0, help='生成的占位图片数量，为 0 时商品没有图片')
+        parser.add_argument('--image-ratio', type=float, default=0.5, help='有图片的商品的比例')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批插入的行数')
+        parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+        parser.add_argument('--no-index', action='store_true', help='不重建商品检索索引')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size 必须大于 0')
+
+        rand = random.Random(options['seed'])
+        start = time.perf_counter()
+
+        if options['users']:
+            seeding.seed_users(options['users'], options['password'], prefix=options['prefix'],
+                               seller_ratio=options['seller_ratio'], batch_size=options['batch_size'], rand=rand,
+                               progress=self.progress('用户'))
+
+        if options['goods']:
+            seller_ids = list(User.objects.filter(type_id=get_usertype_id('seller')).values_list('pk', flat=True))
+            if not seller_ids:
+                raise CommandError('没有商家用户，无法生成商品')
+
+            images = seeding.create_placeholder_images(options['images'], rand=rand)
+            seeding.seed_goods(options['goods'], seller_ids, images=images, image_ratio=options['image_ratio'],
+                               batch_size=options['batch_size'], rand=rand, progress=self.progress('商品'))
+
+            # bulk_create 不发送信号，需要重建检索索引、校正商家汇总数据并使列表缓存失效
+            if not options['no_index']:
+                count = search.rebuild_index(Goods.objects.all())
+                self.stdout.write(f'已重建检索索引：{count} 个商品')
+            SellerSummary.reconcile()
+            caching.bump_catalog_generation()
+
+        self.stdout.write(self.style.SUCCESS(f'完成，用时 {time.perf_counter() - start:.1f}s 。'))
+
+    def progress(self, name):
+        def report(created, total):
+            self.stdout.write(f'{name}：{created}/{total}')
+        return report
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+
+from .models import User
+
+
+def load_current_user(request):
+    """从会话中读取当前用户对象，用户类型通过 JOIN 一并取出
+
+    请求中没有会话 cookie 时不访问会话，匿名访问的响应不会因此添加 Vary: Cookie 。
+    """
+
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return None
+
+    try:
+        user_id = request.session['user_id']
+        return User.objects.select_related('type').get(id=user_id)
+    except (User.DoesNotExist, KeyError) as e:
+        # 删除无效的用户登陆关联
+        if type(e) is User.DoesNotExist:
+            request.session.flush()
+
+        return None
+
+
+def resolve_current_user(request):
+    """返回已解析的当前用户对象，未登录时为 None"""
+
+    current_user = request.current_user
+    if isinstance(current_user, SimpleLazyObject):
+        # 延迟对象无法表示 None ，首次读取时替换为解析的结果
+        if current_user._wrapped is empty:
+            current_user._setup()
+        current_user = request.current_user = current_user._wrapped
+    return current_user
+
+
+class CurrentUserMiddleware:
+    """当前用户中间件
+
+    request.current_user 在首次读取时才解析（之后替换为解析的结果，未登录时为 None ），
+    媒体文件、静态文件等不使用当前用户的请求不会读取会话和查询用户。
+    每个请求最多解析一次，请通过 views.get_current_user() 读取。必须放在 SessionMiddleware 之后。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.current_user = SimpleLazyObject(lambda: load_current_user(request))
+        return self.get_response(request)
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-16 20:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import shop.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Goods',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('goods_name', models.CharField(max_length=40)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('image', models.ImageField(blank=True, null=True, upload_to=shop.models.goods_image_custom_path)),
+                ('description', models.TextField(blank=True, max_length=1024, null=True)),
+                ('version', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+            ],
+            bases=(shop.models.DirtyFieldsMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='UserType',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('typename', models.CharField(max_length=20, unique=True)),
+                ('description', models.CharField(blank=True, max_length=100, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=20, unique=True)),
+                ('password', models.CharField(max_length=60)),
+                ('email', models.CharField(max_length=320)),
+                ('type', models.ForeignKey(default=0, on_delete=django.db.models.deletion.PROTECT, to='shop.usertype')),
+            ],
+            bases=(shop.models.DirtyFieldsMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='GoodsImageVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=10)),
+                ('image', models.ImageField(max_length=200, upload_to=shop.models.goods_image_variant_path)),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='shop.goods')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='goods',
+            name='seller',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='shop.user'),
+        ),
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['seller', 'id'], name='shop_goods_seller_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['seller', 'price'], name='shop_goods_seller_price_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+# 与 fixtures/models_init.json 相同的初始用户类型
+USERTYPES = [
+    (0, 'normal', '普通用户，拥有购买商品权限。'),
+    (100, 'admin', '管理员，拥有最高权限。'),
+    (200, 'seller', '商户，拥有管理商铺的权限。'),
+]
+
+
+def create_usertypes(apps, schema_editor):
+    UserType = apps.get_model('shop', 'UserType')
+    for pk, typename, description in USERTYPES:
+        UserType.objects.using(schema_editor.connection.alias) \
+            .update_or_create(pk=pk, defaults={'typename': typename, 'description': description})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_usertypes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """邮箱不区分大小写的唯一索引
+
+    Django 3.2 的 UniqueConstraint 还不支持表达式，因此直接使用 SQL 创建函数索引。
+    注册时按 LOWER(email) 查询已有邮箱（见 User.objects.filter_email），可直接使用此索引。
+    """
+
+    dependencies = [
+        ('shop', '0002_usertypes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX shop_user_email_lower_uniq ON shop_user (LOWER(email))',
+            'DROP INDEX shop_user_email_lower_uniq',
+        ),
+    ]
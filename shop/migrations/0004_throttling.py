@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-16 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_user_email_lower_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PasswordCheckLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expires', models.FloatField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('updated', models.FloatField()),
+            ],
+        ),
+    ]
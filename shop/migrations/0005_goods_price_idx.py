@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-16 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_throttling'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='goods',
+            index=models.Index(fields=['price', 'id'], name='shop_goods_price_id_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-16 20:48
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Max
+import django.db.models.deletion
+
+
+def build_seller_summaries(apps, schema_editor):
+    """按已有的商品生成商家的汇总数据"""
+
+    Goods = apps.get_model('shop', 'Goods')
+    SellerSummary = apps.get_model('shop', 'SellerSummary')
+    using = schema_editor.connection.alias
+    rows = Goods.objects.using(using).order_by().values('seller_id').annotate(
+        goods_count=Count('id'), min_price=Min('price'), max_price=Max('price'))
+    SellerSummary.objects.using(using).bulk_create([SellerSummary(**row) for row in rows.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_goods_price_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerSummary',
+            fields=[
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='shop.user')),
+                ('goods_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=16, null=True)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=16, null=True)),
+            ],
+        ),
+        migrations.RunPython(build_seller_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from shop import search
+
+
+def create_goods_index(apps, schema_editor):
+    """创建商品全文检索的索引表（仅 SQLite ），并为已有的商品建立索引"""
+
+    Goods = apps.get_model('shop', 'Goods')
+    using = schema_editor.connection.alias
+    search.rebuild_index(Goods.objects.using(using), using=using)
+
+
+def drop_goods_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_seller_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_goods_index, drop_goods_index),
+    ]
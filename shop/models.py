@@ -1,11 +1,25 @@
-from django.db import models
-from django.db.models.signals import pre_save
+import logging
+
+from django.conf import settings
+from django.db import models, transaction, close_old_connections
+from django.db.models import F, Value, Count, Min, Max
+from django.db.models.functions import Lower, Least, Greatest, Coalesce, Cast
+from django.db.utils import IntegrityError
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import cached_property, classproperty
 
 from .apps import ShopConfig
+from . import search
+from . import hashing
+from . import caching
+from . import images
 
 import uuid
-import bcrypt
+
+
+logger = logging.getLogger(__name__)
 
 
 # 媒体文件路径
@@ -22,6 +36,80 @@ def goods_image_custom_path(_, filename):
     return filename
 
 
+class DirtyFieldsMixin:
+    """字段修改跟踪
+
+    记录对象从数据库加载（或保存）时各字段的值，以便判断哪些字段被修改过。
+    保存已存在于数据库中的对象时，若未指定 update_fields ，则只更新被修改过的字段；
+    没有字段被修改时不执行任何 SQL 。
+    """
+
+    def _field_values(self):
+        values = {}
+        for field in self._meta.concrete_fields:
+            # 延迟加载的字段不在 __dict__ 中，跳过
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            value = self.__dict__[field.attname]
+            if isinstance(field, models.FileField):
+                value = getattr(value, 'name', value)
+            values[field.attname] = value
+        return values
+
+    def _reset_loaded_values(self, fields=None):
+        values = self._field_values()
+        if fields is not None and getattr(self, '_loaded_values', None) is not None:
+            loaded = self._loaded_values
+            loaded.update((k, v) for k, v in values.items() if k in fields)
+            values = loaded
+        self._loaded_values = values
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._reset_loaded_values()
+        return instance
+
+    def get_dirty_fields(self):
+        """返回被修改过的字段的 attname 列表，尚未保存到数据库的对象返回所有字段"""
+
+        loaded = getattr(self, '_loaded_values', None)
+        current = self._field_values()
+        if self._state.adding or loaded is None:
+            return list(current)
+
+        return [attname for attname, value in current.items()
+                if attname not in loaded or loaded[attname] != value]
+
+    def is_dirty(self, attname):
+        """字段是否被修改过"""
+
+        return attname in self.get_dirty_fields()
+
+    def save(self, *args, **kwargs):
+        if not args \
+                and not self._state.adding \
+                and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert') \
+                and getattr(self, '_loaded_values', None) is not None:
+            kwargs['update_fields'] = self.get_dirty_fields()
+
+        update_fields = kwargs.get('update_fields')
+        super().save(*args, **kwargs)
+
+        # 指定了 update_fields 时，未写入的字段仍保持修改状态
+        if update_fields is None:
+            self._reset_loaded_values()
+        else:
+            self._reset_loaded_values({self._meta.get_field(name).attname for name in update_fields})
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is not None:
+            fields = {self._meta.get_field(f).attname for f in fields}
+        self._reset_loaded_values(fields)
+
+
 class UserType(models.Model):
     """用户类型模型"""
 
@@ -32,55 +120,438 @@ class UserType(models.Model):
         return self.typename
 
 
-class User(models.Model):
-    """用户模型"""
+# 用户类型名称到ID的映射缓存，为 None 时表示尚未加载
+_usertype_ids = None
+
+
+def get_usertype_ids():
+    """获取用户类型名称到ID的映射
+
+    首次调用时从数据库加载，之后直接使用进程内的缓存。UserType 被保存或删除时缓存将失效。
+    注意：缓存只在当前进程内失效，其他进程中的缓存需要等待进程重启。
+    """
+
+    global _usertype_ids
+
+    usertype_ids = _usertype_ids
+    if usertype_ids is None:
+        usertype_ids = dict(UserType.objects.values_list('typename', 'id'))
+        _usertype_ids = usertype_ids
+    return usertype_ids
+
+
+def get_usertype_id(typename):
+    """获取用户类型名称对应的ID，类型不存在时抛出 UserType.DoesNotExist"""
+
+    try:
+        return get_usertype_ids()[typename]
+    except KeyError:
+        raise UserType.DoesNotExist(f'UserType "{typename}" does not exist.')
+
+
+def clear_usertype_cache():
+    """清除用户类型缓存"""
+
+    global _usertype_ids
+    _usertype_ids = None
+
+
+class UserQuerySet(models.QuerySet):
+
+    def filter_email(self, *emails):
+        """按邮箱过滤（不区分大小写），使用 LOWER(email) 上的唯一索引"""
+
+        return self \
+            .annotate(email_lower=Lower('email')) \
+            .filter(email_lower__in=[email.lower() for email in emails])
+
+
+def unique_error_field(model, error):
+    """找出唯一约束冲突（IntegrityError）对应的字段，无法判断时返回 None
+
+    字段根据模型的 UNIQUE_CONSTRAINT_FIELDS 匹配数据库驱动给出的约束名称或错误信息。
+    """
+
+    diag = getattr(error.__cause__, 'diag', None)
+    sources = [getattr(diag, 'constraint_name', None) or '', str(error)]
+    for name, field in model.UNIQUE_CONSTRAINT_FIELDS.items():
+        if any(name in source for source in sources):
+            return field
+    return None
+
+
+class User(DirtyFieldsMixin, models.Model):
+    """用户模型
+
+    邮箱不区分大小写地唯一，由迁移 0003 中 LOWER(email) 上的唯一索引保证。
+    """
 
     username = models.CharField(max_length=20, unique=True)
     password = models.CharField(max_length=60)
     email = models.CharField(max_length=320)
     type = models.ForeignKey(UserType, on_delete=models.PROTECT, default=0)
 
-    SALT_ROUNDS = 12
+    objects = UserQuerySet.as_manager()
+
+    # 唯一约束的名称（PostgreSQL）或错误信息中的列名（SQLite、MySQL）到字段名的映射，见 unique_error_field()
+    UNIQUE_CONSTRAINT_FIELDS = {
+        'shop_user_email_lower_uniq': 'email',
+        'shop_user_username_key': 'username',
+        'shop_user.username': 'username',
+    }
+
     SALT_PREFIX = b'2b'
 
+    @classproperty
+    def SALT_ROUNDS(cls):
+        """轮数可在 settings.SHOP_PASSWORD_ROUNDS 中配置，使用 calibrate_bcrypt 命令测量本机合适的轮数
+
+        每次使用时读取配置，修改后不需要重启进程。
+        """
+
+        return getattr(settings, 'SHOP_PASSWORD_ROUNDS', 12)
+
     def __str__(self):
         return self.username
 
     def check_password(self, pw):
-        """验证密码是否正确"""
+        """验证密码是否正确
+
+        密码正确但哈希的轮数与当前配置不同时，在后台使用当前配置重新计算哈希。
+        """
 
         if pw is None:
             return False
 
+        # 哈希计算繁忙时将抛出 hashing.PasswordHasherBusy
         try:
-            checked = bcrypt.checkpw(password=pw.encode('utf-8'), hashed_password=self.password.encode('utf-8'))
+            checked = hashing.get_hasher().check(pw, self.password)
         except ValueError:
             checked = False
+
+        if checked and hashing.needs_rehash(self.password, self.SALT_ROUNDS, self.SALT_PREFIX):
+            user_id, old_password = self.pk, self.password
+            transaction.on_commit(lambda: hashing.submit_background(_rehash_in_background, user_id, pw, old_password))
         return checked
 
 
-class Goods(models.Model):
+def rehash_password(user_id, pw, old_password):
+    """使用当前配置的轮数重新计算用户的密码哈希，返回是否已更新"""
+
+    password = hashing.get_hasher().hash(pw, User.SALT_ROUNDS, User.SALT_PREFIX)
+    # 期间密码已被修改时不覆盖；直接 UPDATE ，不再经过 before_user_save 计算哈希
+    return User.objects.filter(pk=user_id, password=old_password).update(password=password) > 0
+
+
+def _rehash_in_background(user_id, pw, old_password):
+    close_old_connections()
+    try:
+        rehash_password(user_id, pw, old_password)
+    except hashing.PasswordHasherBusy:
+        # 哈希服务繁忙，下次登陆时再重新计算
+        pass
+    except Exception:
+        logger.exception('Failed to rehash password for user %s', user_id)
+    finally:
+        close_old_connections()
+
+
+class Goods(DirtyFieldsMixin, models.Model):
     """商品模型"""
 
     goods_name = models.CharField(max_length=40)
-    seller = models.ForeignKey(User, on_delete=models.CASCADE)
+    # 外键的查询由 (seller, id) 索引支持，不再单独创建索引
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     price = models.DecimalField(max_digits=16, decimal_places=2)
     image = models.ImageField(null=True, blank=True, upload_to=goods_image_custom_path)
     description = models.TextField(max_length=1024, null=True, blank=True)
+    # 内容版本，商品或其展示内容被修改时更新，用作缓存键和 ETag
+    version = models.UUIDField(default=uuid.uuid4, editable=False)
+    # 最后修改时间，用作 Last-Modified
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # 按商家过滤并按ID排序（商品列表的游标分页）
+            models.Index(fields=['seller', 'id'], name='shop_goods_seller_id_idx'),
+            # 按商家过滤并按价格排序或过滤
+            models.Index(fields=['seller', 'price'], name='shop_goods_seller_price_idx'),
+            # 按价格区间过滤并按价格排序
+            models.Index(fields=['price', 'id'], name='shop_goods_price_id_idx'),
+        ]
 
     def __str__(self):
         return self.goods_name
 
+    @cached_property
+    def image_variant_list(self):
+        """商品图片的所有缩略图，按宽度排序"""
+
+        return sorted(self.image_variants.all(), key=lambda v: v.width)
+
+    def _srcset(self, image_format):
+        return ', '.join(f'{v.image.url} {v.width}w' for v in self.image_variant_list if v.format == image_format)
+
+    @property
+    def jpeg_srcset(self):
+        return self._srcset('jpeg')
+
+    @property
+    def webp_srcset(self):
+        return self._srcset('webp')
+
+    @property
+    def thumbnail_url(self):
+        """最小的 JPEG 缩略图，没有缩略图时为原图"""
+
+        for variant in self.image_variant_list:
+            if variant.format == 'jpeg':
+                return variant.image.url
+        return self.image.url if self.image else None
+
+    def touch(self):
+        """更新内容版本和最后修改时间"""
+
+        self.version = uuid.uuid4()
+        self.updated_at = timezone.now()
+
+    def save(self, *args, **kwargs):
+        # 内容被修改时更新版本
+        if not self._state.adding and self.get_dirty_fields():
+            self.touch()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'version', 'updated_at'}
+
+        super().save(*args, **kwargs)
+
+
+class SellerSummary(models.Model):
+    """商家店铺的汇总数据：商品数量和价格区间
+
+    由 Goods 的 post_save / post_delete 信号增量维护，店铺页头部只需查询一行。
+    bulk_create 、QuerySet.update() 等不发送信号的修改之后，需执行 reconcile_seller_summaries 命令校正。
+    """
+
+    seller = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    goods_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=16, decimal_places=2, null=True)
+    max_price = models.DecimalField(max_digits=16, decimal_places=2, null=True)
+
+    def __str__(self):
+        return str(self.seller_id)
+
+    @staticmethod
+    def _price_value(price):
+        # SQLite 中参数形式的 Decimal 是文本，需转换为数值才能与价格列比较大小
+        return Cast(Value(price), output_field=models.DecimalField(max_digits=16, decimal_places=2))
+
+    @classmethod
+    def aggregate(cls, seller_id):
+        """从商品表中统计商家的汇总数据，返回 (商品数量, 最低价, 最高价)"""
+
+        result = Goods.objects.filter(seller_id=seller_id).aggregate(Count('id'), Min('price'), Max('price'))
+        return result['id__count'], result['price__min'], result['price__max']
+
+    @classmethod
+    def refresh(cls, seller_id):
+        """按商品表重新统计商家的汇总数据"""
+
+        goods_count, min_price, max_price = cls.aggregate(seller_id)
+        try:
+            with transaction.atomic():
+                cls.objects.update_or_create(seller_id=seller_id, defaults={
+                    'goods_count': goods_count, 'min_price': min_price, 'max_price': max_price,
+                })
+        except IntegrityError:
+            # 商家已被删除
+            pass
+
+    @classmethod
+    def goods_added(cls, seller_id, price):
+        price = cls._price_value(Goods._meta.get_field('price').to_python(price))
+        updated = cls.objects.filter(seller_id=seller_id).update(
+            goods_count=F('goods_count') + 1,
+            min_price=Least(Coalesce(F('min_price'), price), price),
+            max_price=Greatest(Coalesce(F('max_price'), price), price),
+        )
+        if not updated:
+            # 商家的第一个商品（或汇总数据尚未建立）
+            cls.refresh(seller_id)
+
+    @classmethod
+    def goods_removed(cls, seller_id, price):
+        price = Goods._meta.get_field('price').to_python(price)
+        updated = cls.objects.filter(seller_id=seller_id).update(goods_count=F('goods_count') - 1)
+        if not updated:
+            return
+
+        # 删除的是最低价或最高价的商品时，从 (seller, price) 索引中重新取出价格区间
+        summary = cls.objects.filter(seller_id=seller_id).values('min_price', 'max_price').first()
+        if summary and (summary['min_price'] is None or price <= summary['min_price']
+                        or summary['max_price'] is None or price >= summary['max_price']):
+            prices = Goods.objects.filter(seller_id=seller_id).aggregate(Min('price'), Max('price'))
+            cls.objects.filter(seller_id=seller_id).update(min_price=prices['price__min'],
+                                                           max_price=prices['price__max'])
+
+    @classmethod
+    def reconcile(cls, batch_size=1000):
+        """按商品表校正所有商家的汇总数据，返回 (新建数量, 更新数量, 删除数量)"""
+
+        expected = {
+            row['seller_id']: (row['goods_count'], row['min_price'], row['max_price'])
+            for row in Goods.objects.order_by().values('seller_id').annotate(
+                goods_count=Count('id'), min_price=Min('price'), max_price=Max('price'))
+        }
+
+        created, updated, stale = [], [], []
+        for summary in cls.objects.iterator():
+            values = expected.pop(summary.seller_id, None)
+            if values is None:
+                stale.append(summary.seller_id)
+            elif values != (summary.goods_count, summary.min_price, summary.max_price):
+                summary.goods_count, summary.min_price, summary.max_price = values
+                updated.append(summary)
+        for seller_id, (goods_count, min_price, max_price) in expected.items():
+            created.append(cls(seller_id=seller_id, goods_count=goods_count, min_price=min_price,
+                               max_price=max_price))
+
+        with transaction.atomic():
+            cls.objects.bulk_create(created, batch_size=batch_size)
+            cls.objects.bulk_update(updated, ['goods_count', 'min_price', 'max_price'], batch_size=batch_size)
+            for i in range(0, len(stale), batch_size):
+                cls.objects.filter(seller_id__in=stale[i:i + batch_size]).delete()
+        return len(created), len(updated), len(stale)
+
+
+def goods_image_variant_path(instance, _):
+    return images.variant_path(instance.goods.image.name, instance.width, instance.format)
+
+
+class GoodsImageVariant(models.Model):
+    """商品图片的缩略图"""
+
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='image_variants')
+    width = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    image = models.ImageField(max_length=200, upload_to=goods_image_variant_path)
+
+    def __str__(self):
+        return self.image.name
+
+
+class ThrottleBucket(models.Model):
+    """限流的令牌桶，由 shop/throttling.py 维护
+
+    tokens 为 updated 时刻桶中的令牌数量，之后按速率补充，读取时再计算当前数量。
+    """
+
+    key = models.CharField(max_length=200, primary_key=True)
+    tokens = models.FloatField()
+    updated = models.FloatField()
+
+    def __str__(self):
+        return self.key
+
+
+class PasswordCheckLease(models.Model):
+    """正在进行的密码哈希计算的租约，用于限制所有工作进程中同时计算的数量"""
+
+    expires = models.FloatField(db_index=True)
+
 
 @receiver(pre_save, sender=User)
 def before_user_save(_=None, instance=None, **__):
     """保存用户的修改之前将调用此函数"""
 
-    try:
-        old_object = User.objects.get(id=instance.id)
-    except User.DoesNotExist:
-        old_object = None
+    # 新用户或密码被修改时重新计算密码哈希
+    if instance.is_dirty('password'):
+        instance.password = hashing.get_hasher().hash(instance.password, User.SALT_ROUNDS, User.SALT_PREFIX)
+
+
+@receiver(post_save, sender=UserType)
+@receiver(post_delete, sender=UserType)
+def after_usertype_change(**__):
+    """修改或删除用户类型之后将调用此函数"""
+
+    clear_usertype_cache()
+
+
+@receiver(post_save, sender=User)
+def after_user_save(_=None, instance=None, created=False, **__):
+    """保存用户的修改之后将调用此函数"""
+
+    # 商品卡片中展示了商家名称，商家改名后需要更新该商家所有商品的版本
+    if not created and instance.is_dirty('username'):
+        Goods.objects.filter(seller=instance).update(version=uuid.uuid4(), updated_at=timezone.now())
+        caching.bump_catalog_generation()
+
+
+@receiver(post_save, sender=Goods)
+def after_goods_save(_=None, instance=None, created=False, using=None, **__):
+    """保存商品之后将调用此函数"""
+
+    search.index_goods(instance, using=using)
+    caching.bump_catalog_generation()
+
+    # 增量更新商家的汇总数据
+    loaded = getattr(instance, '_loaded_values', None)
+    if created:
+        SellerSummary.goods_added(instance.seller_id, instance.price)
+    elif loaded is None:
+        SellerSummary.refresh(instance.seller_id)
+    elif instance.is_dirty('seller_id') or instance.is_dirty('price'):
+        old_seller_id, old_price = loaded.get('seller_id'), loaded.get('price')
+        if old_seller_id is None or old_price is None:
+            # 以延迟加载的方式取出的商品没有修改前的值，重新统计
+            # （未加载商家而直接更换商家时无法得知原商家，需执行 reconcile_seller_summaries 命令校正）
+            SellerSummary.refresh(instance.seller_id)
+            if old_seller_id is not None and old_seller_id != instance.seller_id:
+                SellerSummary.refresh(old_seller_id)
+        else:
+            SellerSummary.goods_removed(old_seller_id, old_price)
+            SellerSummary.goods_added(instance.seller_id, instance.price)
+
+    # 商品图片被修改后生成缩略图
+    if created or instance.is_dirty('image'):
+        if not created:
+            # 旧图片的缩略图立即失效（商品版本已在 save() 中更新），文件在事务提交后删除
+            variants = GoodsImageVariant.objects.using(using).filter(goods_id=instance.pk)
+            names = list(variants.values_list('image', flat=True))
+            if names:
+                variants.delete()
+                transaction.on_commit(lambda: images.delete_variant_files(names), using=using)
+            instance.__dict__.pop('image_variant_list', None)
+        if instance.image:
+            images.schedule_image_variants(instance.pk)
+
+
+@receiver(pre_delete, sender=Goods)
+def before_goods_delete(_=None, instance=None, using=None, **__):
+    """删除商品之前将调用此函数"""
+
+    # 缩略图的记录会随商品级联删除，先记下其文件名
+    instance._variant_image_names = list(
+        GoodsImageVariant.objects.using(using).filter(goods_id=instance.pk).values_list('image', flat=True))
+
+    # 删除后无法再加载延迟加载的字段，先取出更新商家汇总数据所需的值
+    if instance.get_deferred_fields() & {'seller_id', 'price'}:
+        instance._summary_values = Goods.objects.using(using) \
+            .filter(pk=instance.pk).values_list('seller_id', 'price').first()
+    else:
+        instance._summary_values = (instance.seller_id, instance.price)
+
+
+@receiver(post_delete, sender=Goods)
+def after_goods_delete(_=None, instance=None, using=None, **__):
+    """删除商品之后将调用此函数"""
+
+    search.unindex_goods(instance.pk, using=using)
+    caching.bump_catalog_generation()
+    summary_values = getattr(instance, '_summary_values', None)
+    if summary_values is not None:
+        SellerSummary.goods_removed(*summary_values)
 
-    if not old_object or old_object.password != instance.password:
-        salt = bcrypt.gensalt(rounds=User.SALT_ROUNDS, prefix=User.SALT_PREFIX)
-        instance.password = bcrypt.hashpw(password=instance.password.encode('utf-8'), salt=salt).decode('utf-8')
+    # 事务提交后删除缩略图文件
+    names = getattr(instance, '_variant_image_names', None)
+    if names:
+        transaction.on_commit(lambda: images.delete_variant_files(names), using=using)
@@ -0,0 +1,208 @@
+import base64
+import binascii
+import json
+import math
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    """分页游标格式错误"""
+
+
+def encode_cursor(values, reverse=False, ordering=None):
+    """将排序键的值编码为不透明的游标字符串
+
+    ordering 为生成游标时的排序方式，解码时可据此拒绝用于其他排序方式的游标。
+    """
+
+    data = {'v': values, 'r': reverse}
+    if ordering is not None:
+        data['o'] = list(ordering)
+    payload = json.dumps(data, separators=(',', ':'), cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, ordering=None):
+    """解码游标字符串，返回 (排序键的值, 是否向前翻页)
+
+    指定 ordering 时，游标必须是按该排序方式生成的。
+    """
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        values, reverse = data['v'], data['r']
+        if ordering is not None and data['o'] != list(ordering):
+            raise InvalidCursor(cursor)
+    except (ValueError, TypeError, KeyError, binascii.Error, UnicodeError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(values, list) or not isinstance(reverse, bool):
+        raise InvalidCursor(cursor)
+    return values, reverse
+
+
+class CursorPaginator:
+    """游标（键集）分页器
+
+    按一组稳定的排序键分页，翻页条件是“排序键大于（或小于）上一页的边界值”，
+    而不是 OFFSET，因此无论翻到多深，每页的查询代价都是一样的。
+
+    Parameters
+    ----------
+    queryset: 待分页的查询集。
+
+    ordering: 排序字段的序列，字段名前加“-”表示降序。最后一个字段必须能唯一确定一行（通常是 pk）。
+
+    per_page: 每页的对象数量。
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        if not ordering:
+            raise ValueError('parameter "ordering" must not be empty')
+
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = int(per_page)
+
+    @property
+    def fields(self):
+        return [f.lstrip('-') for f in self.ordering]
+
+    def page(self, cursor=None):
+        """返回游标所指向的页，游标为空时返回第一页"""
+
+        if cursor:
+            values, reverse = decode_cursor(cursor, self.ordering)
+            if len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            values = self.to_python(values, cursor)
+        else:
+            values, reverse = None, False
+
+        return CursorPage(self, values, reverse)
+
+    def get_field(self, name):
+        """排序字段（模型字段或注解）对应的字段对象"""
+
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        opts = self.queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def to_python(self, values, cursor=None):
+        """将游标中的值转换为排序字段的类型
+
+        游标由客户端提交，值的类型可能被篡改，格式错误时抛出 InvalidCursor 。
+        """
+
+        result = []
+        try:
+            for name, value in zip(self.fields, values):
+                if value is None or isinstance(value, (list, dict)):
+                    raise TypeError(value)
+                value = self.get_field(name).to_python(value)
+                if isinstance(value, float) and not math.isfinite(value) or \
+                        hasattr(value, 'is_finite') and not value.is_finite():
+                    raise ValueError(value)
+                result.append(value)
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        return result
+
+    def keyset_filter(self, values, reverse=False):
+        """生成“位于边界值之后（reverse 时为之前）”的过滤条件"""
+
+        condition = Q()
+        for i, order in enumerate(self.ordering):
+            descending = order.startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+
+            term = Q(**{f'{self.fields[i]}__{lookup}': values[i]})
+            for field, value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{field: value})
+            condition |= term
+
+        return condition
+
+    def reversed_ordering(self):
+        return [f[1:] if f.startswith('-') else f'-{f}' for f in self.ordering]
+
+    def values_of(self, obj):
+        """取出对象的排序键的值"""
+
+        return [getattr(obj, field) for field in self.fields]
+
+
+class CursorPage:
+    """游标分页的一页
+
+    页面内容在首次访问时才会查询，每页只需一次查询（多取一行用于判断是否还有下一页）。
+    """
+
+    def __init__(self, paginator, values, reverse):
+        self.paginator = paginator
+        self.values = values
+        self.reverse = reverse
+
+    def __repr__(self):
+        return '<CursorPage>'
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @cached_property
+    def _rows(self):
+        paginator = self.paginator
+        queryset = paginator.queryset
+        ordering = paginator.ordering
+
+        if self.values is not None:
+            queryset = queryset.filter(paginator.keyset_filter(self.values, self.reverse))
+        if self.reverse:
+            ordering = paginator.reversed_ordering()
+
+        rows = list(queryset.order_by(*ordering)[:paginator.per_page + 1])
+        has_more = len(rows) > paginator.per_page
+        rows = rows[:paginator.per_page]
+
+        if self.reverse:
+            rows.reverse()
+        return rows, has_more
+
+    @property
+    def object_list(self):
+        return self._rows[0]
+
+    def has_next(self):
+        # 向前翻页得到的页，其后必然还有内容
+        return self.reverse or self._rows[1]
+
+    def has_previous(self):
+        if self.reverse:
+            return self._rows[1]
+        return self.values is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return encode_cursor(self.paginator.values_of(self.object_list[-1]), ordering=self.paginator.ordering)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return encode_cursor(self.paginator.values_of(self.object_list[0]), reverse=True,
+                             ordering=self.paginator.ordering)
@@ -0,0 +1,183 @@
+"""商品全文检索
+
+基于 SQLite FTS5 建立商品名称和商品描述的倒排索引。
+FTS5 自带的分词器无法切分中文，因此文本先在 Python 中分词（中日韩文字切分为单字和相邻的双字，
+其他文字按单词切分），再以空格连接后写入索引表。检索词使用同样的方法分词，结果按 bm25 相关度排序。
+
+数据库不是 SQLite 或不支持 FTS5 时，检索退化为对商品名称的模糊匹配。
+"""
+
+import re
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.utils import OperationalError
+
+
+# 索引表名称
+INDEX_TABLE = 'shop_goods_fts'
+# 索引列的权重（商品名称、商品描述），用于相关度计算
+INDEX_WEIGHTS = (10.0, 1.0)
+
+_CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_TOKEN_RE = re.compile(f'([{_CJK_CHARS}]+)|([^\\W_{_CJK_CHARS}]+)')
+
+# 已确认存在索引表的数据库
+_available_databases = set()
+
+
+def tokenize(text):
+    """将文本切分为索引词
+
+    中日韩文字的连续片段切分为单字和相邻的双字，其他文字按单词切分并转为小写。
+    """
+
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(text or ''):
+        if cjk:
+            tokens.extend(cjk)
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def build_match_query(keywords):
+    """将检索词转换为 FTS5 的 MATCH 表达式，检索词中没有可用的词时返回 None
+
+    中日韩文字片段要求命中其中所有的双字（单个字时为该字），其他单词按前缀匹配。
+    """
+
+    terms = []
+    for cjk, word in _TOKEN_RE.findall(keywords or ''):
+        if len(cjk) == 1:
+            terms.append(f'"{cjk}"')
+        elif cjk:
+            terms.extend(f'"{cjk[i:i + 2]}"' for i in range(len(cjk) - 1))
+        else:
+            terms.append(f'"{word.lower()}"*')
+
+    return ' AND '.join(terms) if terms else None
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    """检查数据库是否可以使用全文检索"""
+
+    if using in _available_databases:
+        return True
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+
+    with connection.cursor() as cursor:
+        if INDEX_TABLE in connection.introspection.table_names(cursor):
+            _available_databases.add(using)
+            return True
+    return False
+
+
+def create_index(using=DEFAULT_DB_ALIAS):
+    """创建索引表（由迁移 0007 调用）"""
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} '
+                           'USING fts5(goods_name, description)')
+    except OperationalError:
+        # SQLite 未编译 FTS5 扩展
+        pass
+
+
+def drop_index(using=DEFAULT_DB_ALIAS):
+    """删除索引表"""
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+    _available_databases.discard(using)
+
+
+def _index_row(goods):
+    return goods.pk, ' '.join(tokenize(goods.goods_name)), ' '.join(tokenize(goods.description))
+
+
+def index_goods(goods, using=DEFAULT_DB_ALIAS):
+    """添加或更新一个商品的索引"""
+
+    if not is_available(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [goods.pk])
+        cursor.execute(f'INSERT INTO {INDEX_TABLE} (rowid, goods_name, description) VALUES (%s, %s, %s)',
+                       _index_row(goods))
+
+
+def unindex_goods(goods_id, using=DEFAULT_DB_ALIAS):
+    """删除一个商品的索引"""
+
+    if not is_available(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [goods_id])
+
+
+def rebuild_index(queryset, using=DEFAULT_DB_ALIAS, batch_size=2000):
+    """清空并按查询集重建索引，返回已索引的商品数量"""
+
+    create_index(using)
+    if not is_available(using):
+        return 0
+
+    count = 0
+    insert_sql = f'INSERT INTO {INDEX_TABLE} (rowid, goods_name, description) VALUES (%s, %s, %s)'
+    queryset = queryset.only('goods_name', 'description').order_by()
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+
+        batch = []
+        for goods in queryset.iterator(chunk_size=batch_size):
+            batch.append(_index_row(goods))
+            if len(batch) >= batch_size:
+                cursor.executemany(insert_sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert_sql, batch)
+            count += len(batch)
+
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')")
+
+    return count
+
+
+def search_goods(queryset, keywords):
+    """按检索词过滤商品查询集
+
+    返回的查询集带有 search_rank 注解，值越小越相关；无法使用全文检索时 search_rank 恒为 0。
+    """
+
+    match = build_match_query(keywords)
+    if match is None or not is_available(queryset.db):
+        return queryset \
+            .filter(goods_name__contains=keywords) \
+            .annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    # 索引表与商品表连接，MATCH 只执行一次，相关度直接取自匹配结果，不再为每个商品单独查询索引
+    table = queryset.model._meta.db_table
+    weights = ', '.join(str(w) for w in INDEX_WEIGHTS)
+    return queryset \
+        .extra(tables=[INDEX_TABLE], where=[f'"{INDEX_TABLE}".rowid = "{table}"."id"', f'"{INDEX_TABLE}" MATCH %s'],
+               params=[match]) \
+        .annotate(search_rank=RawSQL(f'bm25("{INDEX_TABLE}", {weights})', [], output_field=FloatField()))
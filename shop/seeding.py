@@ -0,0 +1,146 @@
+"""批量生成测试数据
+
+逐个保存 User 时，before_user_save 会为每个用户计算一次 bcrypt 哈希（12 轮约需数百毫秒），
+生成大量用户需要数小时。此处所有生成的用户共用一个预先计算的密码哈希，并使用 bulk_create
+按批插入（不发送信号），数百万行数据只需几分钟。插入后需重建检索索引，见 seed_shop 命令。
+"""
+
+import hashlib
+import random
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image, ImageDraw
+
+from .hashing import get_hasher
+from .models import User, Goods, get_usertype_id, goods_image_custom_path
+
+
+# 商品名称的组成部分：(品类, 价格区间, 品牌, 修饰词, 规格)
+GOODS_CATEGORIES = [
+    ('机械键盘', (99, 1299), ['罗技', '雷柏', '樱桃', '达尔优', '新贵'], ['RGB背光', '无线', '87键', '青轴', '茶轴'],
+     ['黑色', '白色', '粉色']),
+    ('无线鼠标', (29, 699), ['罗技', '雷蛇', '小米', '微软'], ['静音', '人体工学', '轻量化', '蓝牙双模'], ['黑色', '灰色']),
+    ('显示器', (599, 8999), ['戴尔', '华硕', '三星', 'LG', 'AOC'], ['4K', '144Hz', 'IPS', '曲面', '护眼'],
+     ['24英寸', '27英寸', '32英寸']),
+    ('笔记本电脑', (2999, 19999), ['联想', '华为', '苹果', '戴尔', '惠普'], ['轻薄', '游戏', '商务', '高性能'],
+     ['16G+512G', '32G+1T', '8G+256G']),
+    ('蓝牙耳机', (59, 2999), ['索尼', '漫步者', '华为', '苹果', '小米'], ['降噪', '入耳式', '头戴式', '运动'], ['白色', '黑色']),
+    ('手机', (799, 12999), ['华为', '小米', '苹果', 'OPPO', 'vivo'], ['5G', '拍照', '长续航', '旗舰'],
+     ['128G', '256G', '512G']),
+    ('充电宝', (39, 399), ['小米', '安克', '罗马仕', '倍思'], ['快充', '大容量', '迷你', '无线充'], ['10000mAh', '20000mAh']),
+    ('台灯', (49, 899), ['飞利浦', '欧普', '小米', '明基'], ['护眼', 'LED', '可调光', '学生'], ['白色', '木纹']),
+    ('保温杯', (29, 399), ['膳魔师', '象印', '富光', '虎牌'], ['不锈钢', '便携', '大容量', '316'], ['350ml', '500ml']),
+    ('运动鞋', (129, 1699), ['李宁', '安踏', '耐克', '阿迪达斯', '特步'], ['透气', '缓震', '轻便', '跑步'], ['39码', '42码', '44码']),
+]
+
+# 占位图片的背景色
+PLACEHOLDER_COLORS = ['#e57373', '#64b5f6', '#81c784', '#ffb74d', '#ba68c8', '#4db6ac', '#a1887f', '#90a4ae']
+
+
+def client_password(password):
+    """客户端提交的密码（浏览器端对明文做 SHA-256）"""
+
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+
+def _batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_users(count, password, prefix='seed', seller_ratio=0.2, batch_size=5000, rand=None, progress=None):
+    """生成用户，返回生成的数量
+
+    用户名为前缀加序号，序号从当前最大的用户ID开始，重复执行也不会冲突。
+    所有用户共用同一个密码哈希，只计算一次 bcrypt 。
+    """
+
+    rand = rand or random.Random()
+    hashed = get_hasher().hash(client_password(password), User.SALT_ROUNDS, User.SALT_PREFIX)
+    normal_type, seller_type = get_usertype_id('normal'), get_usertype_id('seller')
+    start = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+    users = (
+        User(username=f'{prefix}{start + i}', password=hashed, email=f'{prefix}{start + i}@example.com',
+             type_id=seller_type if rand.random() < seller_ratio else normal_type)
+        for i in range(count)
+    )
+
+    created = 0
+    for batch in _batches(users, batch_size):
+        with transaction.atomic():
+            User.objects.bulk_create(batch)
+        created += len(batch)
+        if progress:
+            progress(created, count)
+    return created
+
+
+def goods_name_and_price(rand):
+    """随机生成一个商品名称及其价格"""
+
+    category, (low, high), brands, adjectives, specs = rand.choice(GOODS_CATEGORIES)
+    name = f'{rand.choice(brands)} {rand.choice(adjectives)}{category} {rand.choice(specs)}'
+    # 价格在区间内按对数均匀分布，尾数为 .00 、.90 或 .99
+    price = int(low * (high / low) ** rand.random())
+    cents = rand.choice(['00', '00', '90', '99'])
+    return name[:40], Decimal(f'{price}.{cents}')
+
+
+def create_placeholder_images(count, rand=None):
+    """生成占位图片并保存到媒体存储中，返回图片名称的列表"""
+
+    rand = rand or random.Random()
+    names = []
+    for i in range(count):
+        image = Image.new('RGB', (640, 640), PLACEHOLDER_COLORS[i % len(PLACEHOLDER_COLORS)])
+        draw = ImageDraw.Draw(image)
+        for _ in range(6):
+            x, y, size = rand.randint(0, 560), rand.randint(0, 560), rand.randint(40, 200)
+            draw.ellipse((x, y, x + size, y + size), fill=rand.choice(PLACEHOLDER_COLORS))
+
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=80)
+        names.append(default_storage.save(goods_image_custom_path(None, 'placeholder.jpg'),
+                                          ContentFile(buffer.getvalue())))
+    return names
+
+
+def seed_goods(count, seller_ids, images=(), image_ratio=0.5, batch_size=5000, rand=None, progress=None):
+    """为指定的商家生成商品，返回生成的数量
+
+    images 为占位图片的名称，按 image_ratio 的比例随机分配给商品（多个商品共用同一张图片）。
+    """
+
+    if not seller_ids:
+        raise ValueError('parameter "seller_ids" must not be empty')
+
+    rand = rand or random.Random()
+    seller_ids = list(seller_ids)
+
+    def make_goods():
+        for _ in range(count):
+            name, price = goods_name_and_price(rand)
+            image = rand.choice(images) if images and rand.random() < image_ratio else None
+            yield Goods(goods_name=name, seller_id=rand.choice(seller_ids), price=price, image=image,
+                        description=f'{name}，正品保证，全国包邮。')
+
+    created = 0
+    for batch in _batches(make_goods(), batch_size):
+        with transaction.atomic():
+            Goods.objects.bulk_create(batch)
+        created += len(batch)
+        if progress:
+            progress(created, count)
+    return created
@@ -0,0 +1,241 @@
+"""文件服务
+
+用于替代 django.views.static.serve 提供媒体文件：
+    - 配置 SHOP_MEDIA_ACCEL 后，Django 只做路径检查，文件交给前端代理（nginx 的 X-Accel-Redirect
+      或 Apache/lighttpd 的 X-Sendfile）直接发送，文件内容不经过 Python 。
+    - 由 Django 自己发送时，完整文件使用 FileResponse ，由 WSGI 服务器的 wsgi.file_wrapper
+      （如 gunicorn）通过 sendfile 零拷贝发送；支持单个 Range 请求、If-Modified-Since 和 ETag 。
+      Range 请求的内容在 Python 中逐块读取，不能使用 sendfile ，只适合开发环境。
+    - 以 uuid 命名的商品图片（见 goods_image_custom_path）内容永不改变，使用长期有效的 immutable 缓存。
+
+静态文件（collectstatic 之后）同样由此提供，并根据 Accept-Encoding 选择预压缩的 .br/.gz 文件，
+见 shop.storage.CompressedManifestStaticFilesStorage ；配置 SHOP_MEDIA_ACCEL 后同样交给前端代理发送。
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+
+# 以 uuid 命名的文件（包括其缩略图）
+IMMUTABLE_FILE_RE = re.compile(r'(^|/)[0-9a-f]{32}(_\w+)?\.\w+$')
+# collectstatic 生成的带内容哈希的静态文件
+HASHED_STATIC_FILE_RE = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+# 预压缩文件的后缀，按优先级排列
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _parse_range(header, size):
+    """解析 Range 请求头，返回 (start, end)（包含 end）；无法处理时返回 None ，范围无效时返回 False"""
+
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # 格式错误或包含多个范围，按 RFC 7233 忽略 Range ，返回完整文件
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if size == 0:
+        # 空文件没有可满足的范围
+        return False
+    if not start:
+        # 后缀范围：最后 N 个字节
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class _RangeFile:
+    """只读取文件中指定范围的类文件对象"""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def serve_file(request, fullpath, url_path, cache_control, accel=None, accel_prefix='',
+               content_type=None, content_encoding=None, vary=None):
+    """发送文件
+
+    Parameters
+    ----------
+    fullpath: 文件的绝对路径。
+
+    url_path: 文件相对于文档根目录的路径，用于 X-Accel-Redirect 。
+
+    cache_control: Cache-Control 响应头。
+
+    accel: None 、'x-accel-redirect' 或 'x-sendfile' 。
+
+    content_type, content_encoding: 默认根据文件名推测。
+
+    vary: Vary 响应头。
+    """
+
+    try:
+        statobj = os.stat(fullpath)
+    except OSError:
+        raise Http404('文件不存在')
+    if not stat.S_ISREG(statobj.st_mode):
+        raise Http404('文件不存在')
+
+    size = statobj.st_size
+    mtime = int(statobj.st_mtime)
+    last_modified = http_date(mtime)
+    etag = f'"{mtime:x}-{size:x}"'
+
+    def set_headers(response):
+        response['Last-Modified'] = last_modified
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        if vary:
+            response['Vary'] = vary
+        return response
+
+    # 条件请求
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        if etag in [t.strip() for t in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return set_headers(HttpResponseNotModified())
+    else:
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if if_modified_since is not None and mtime <= if_modified_since:
+            return set_headers(HttpResponseNotModified())
+
+    guessed_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or guessed_type or 'application/octet-stream'
+    encoding = content_encoding or encoding
+
+    # 交给前端代理发送文件，Range 等请求由代理处理
+    if accel in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if accel == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(url_path)
+        else:
+            response['X-Sendfile'] = fullpath
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return set_headers(response)
+
+    # Range 请求（If-Range 与当前文件不匹配时返回完整文件）
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and request.method in ('GET', 'HEAD'):
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range.strip() in (etag, last_modified):
+            byte_range = _parse_range(range_header, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return set_headers(response)
+
+    if byte_range is None:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(_RangeFile(open(fullpath, 'rb'), start, length),
+                                status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+
+    response.block_size = 64 * 1024
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return set_headers(response)
+
+
+def serve_media(request, path):
+    """媒体文件视图"""
+
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(os.path.abspath(settings.MEDIA_ROOT), path)
+    except SuspiciousFileOperation:
+        raise Http404('文件不存在')
+
+    if IMMUTABLE_FILE_RE.search(path):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = f'public, max-age={getattr(settings, "SHOP_MEDIA_MAX_AGE", 3600)}'
+
+    return serve_file(request, fullpath, path, cache_control,
+                      accel=getattr(settings, 'SHOP_MEDIA_ACCEL', None),
+                      accel_prefix=getattr(settings, 'SHOP_MEDIA_ACCEL_PREFIX', '/protected-media/'))
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def serve_static(request, path):
+    """静态文件视图（需先执行 collectstatic）"""
+
+    path = posixpath.normpath(path).lstrip('/')
+    static_root = getattr(settings, 'STATIC_ROOT', None)
+    if not static_root:
+        raise Http404('文件不存在')
+    try:
+        fullpath = safe_join(os.path.abspath(static_root), path)
+    except SuspiciousFileOperation:
+        raise Http404('文件不存在')
+
+    if HASHED_STATIC_FILE_RE.search(path):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = f'public, max-age={getattr(settings, "SHOP_MEDIA_MAX_AGE", 3600)}'
+
+    # 选择客户端可接受的预压缩文件
+    content_type = mimetypes.guess_type(fullpath)[0]
+    accepted = _accepted_encodings(request)
+    accel = getattr(settings, 'SHOP_MEDIA_ACCEL', None)
+    accel_prefix = getattr(settings, 'SHOP_STATIC_ACCEL_PREFIX', '/protected-static/')
+    for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+        if encoding in accepted and os.path.isfile(fullpath + suffix):
+            return serve_file(request, fullpath + suffix, path + suffix, cache_control,
+                              accel=accel, accel_prefix=accel_prefix,
+                              content_type=content_type, content_encoding=encoding, vary='Accept-Encoding')
+
+    return serve_file(request, fullpath, path, cache_control, accel=accel, accel_prefix=accel_prefix,
+                      vary='Accept-Encoding')
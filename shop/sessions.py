@@ -0,0 +1,62 @@
+"""会话引擎
+
+在 cached_db 会话的基础上：
+    - 写入与原值相同的数据时不标记为已修改，内容没有变化的会话不会被重新写入数据库和缓存；
+    - 按批删除过期的会话，避免一条 DELETE 长时间锁住会话表。
+在 settings.SESSION_ENGINE 中设置为 'shop.sessions' 后生效，过期会话由 purge_sessions 命令清理。
+"""
+
+import copy
+
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.utils import timezone
+
+
+class SessionStore(CachedDBStore):
+
+    def _get_session(self, no_load=False):
+        loaded = hasattr(self, '_session_cache')
+        session = super()._get_session(no_load)
+        if not loaded:
+            # 记录加载时的数据，保存时与之比较
+            self._loaded_session = copy.deepcopy(session)
+        return session
+
+    _session = property(_get_session)
+
+    def __setitem__(self, key, value):
+        if key in self._session and self._session[key] == value:
+            return
+        super().__setitem__(key, value)
+
+    def update(self, dict_):
+        for key, value in dict_.items():
+            self[key] = value
+
+    def save(self, must_create=False):
+        # 已存在的会话内容没有变化时不重新写入
+        if not must_create and self.session_key and self._session == getattr(self, '_loaded_session', None):
+            self.modified = False
+            return
+        super().save(must_create)
+        self._loaded_session = copy.deepcopy(self._session)
+
+    @classmethod
+    def clear_expired(cls, batch_size=1000, progress=None):
+        """按批删除过期的会话，返回删除的数量
+
+        缓存中的会话与数据库中的同时过期，不需要单独删除。
+        progress 在每批删除后以已删除的数量为参数调用。
+        """
+
+        model = cls.get_model_class()
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                break
+            deleted += model.objects.filter(session_key__in=keys).delete()[0]
+            if progress:
+                progress(deleted)
+        return deleted
@@ -0,0 +1,62 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """带内容哈希文件名并预压缩的静态文件存储
+
+    执行 collectstatic 时，在生成带内容哈希的文件（如 style.3f2a1b9c0d4e.css）之后，
+    为其中的文本文件写入 .gz 和 .br （需安装 brotli）压缩版本，由 shop.serving.serve_static
+    根据 Accept-Encoding 选择发送，避免每次请求时压缩。
+    """
+
+    # 清单中没有的文件按文件内容计算哈希文件名，文件不存在时仍然报错
+    manifest_strict = False
+    # 需要预压缩的文件类型
+    compress_extensions = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.map')
+    # 小于此大小（字节）的文件不压缩
+    compress_min_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        # 多轮处理中会产生中间文件名，只压缩最终写入清单的文件
+        for name in sorted(set(self.hashed_files.values())):
+            for compressed_name in self.compress(name):
+                yield name, compressed_name, True
+
+    def compress(self, name):
+        """为文件写入压缩版本，返回写入的文件名"""
+
+        if os.path.splitext(name)[1].lower() not in self.compress_extensions:
+            return []
+
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < self.compress_min_size:
+            return []
+
+        compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+        written = []
+        for suffix, compressor in compressors:
+            compressed = compressor(content)
+            # 压缩后没有变小的文件不保留压缩版本
+            if len(compressed) >= len(content):
+                continue
+
+            with open(self.path(name + suffix), 'wb') as f:
+                f.write(compressed)
+            written.append(name + suffix)
+        return written
@@ -1,17 +1,91 @@
+import datetime
+import gzip
 import hashlib
 import json
-
-from django.test import TestCase, Client
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections, IntegrityError
+from django.db.models import QuerySet
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.shortcuts import reverse
+from django.templatetags.static import static
+from PIL import Image
 
-from .models import User, Goods
+from .models import (User, UserType, Goods, GoodsImageVariant, get_usertype_id, get_usertype_ids, clear_usertype_cache,
+                     unique_error_field, ThrottleBucket, PasswordCheckLease, SellerSummary)
 from .forms import RegisterBEForm, RegisterFEForm, LoginBEForm, LoginFEForm
+from .pagination import CursorPaginator, InvalidCursor, encode_cursor, decode_cursor
+from .views import GoodsListView
+from . import search, images, caching, utils, benchmark, hashing, importing, sessions, throttling, models
+from .hashing import PasswordHasher, PasswordHasherBusy
+
+
+# 运行测试时没有执行 collectstatic ，使用不带哈希的存储（StaticPipelineTest 中单独启用）
+_static_storage_override = override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+
+
+def setUpModule():
+    _static_storage_override.enable()
+
+
+def tearDownModule():
+    _static_storage_override.disable()
 
 
 def password_encode(password):
     return hashlib.sha256(bytes(password, encoding='utf-8')).hexdigest()
 
 
+class _AssertQueryBudgetContext(CaptureQueriesContext):
+
+    def __init__(self, test_case, budget, connection):
+        self.test_case = test_case
+        self.budget = budget
+        super().__init__(connection)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+
+        executed = len(self)
+        queries = '\n'.join(f'{i}. {q["sql"]}' for i, q in enumerate(self.captured_queries, start=1))
+        self.test_case.assertLessEqual(
+            executed, self.budget,
+            f'{executed} queries executed, but the budget is {self.budget}\nCaptured queries were:\n{queries}'
+        )
+
+
+class QueryBudgetMixin:
+    """查询预算断言
+
+    用于 TestCase，当代码块中执行的 SQL 查询数量超出预算时测试失败。
+
+    Examples
+    --------
+    with self.assertQueryBudget(2):
+        self.client.get(url)
+    """
+
+    def assertQueryBudget(self, budget, using='default'):
+        return _AssertQueryBudgetContext(self, budget, connections[using])
+
+
 class UserModelTest(TestCase):
     """用户模型测试"""
 
@@ -19,6 +93,212 @@ class UserModelTest(TestCase):
         u = User.objects.create(username='abc', password='123', email='a@qq.com')
         self.assertIn(u, User.objects.all())
 
+    def test_dirty_fields(self):
+        User.objects.create(username='abc', password='123', email='a@qq.com')
+        u = User.objects.get(username='abc')
+        hashed_password = u.password
+        self.assertEqual(u.get_dirty_fields(), [])
+
+        # 没有修改时不执行任何 SQL
+        with self.assertNumQueries(0):
+            u.save()
+
+        # 只更新被修改的字段，且不重新计算密码哈希
+        u.email = 'b@qq.com'
+        self.assertEqual(u.get_dirty_fields(), ['email'])
+        with CaptureQueriesContext(connections['default']) as context:
+            u.save()
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('UPDATE', context.captured_queries[0]['sql'])
+        self.assertNotIn('"password"', context.captured_queries[0]['sql'])
+        self.assertEqual(u.password, hashed_password)
+        self.assertEqual(u.get_dirty_fields(), [])
+
+        # 修改密码后重新计算密码哈希
+        u.password = '456'
+        with self.assertNumQueries(1):
+            u.save()
+        self.assertTrue(u.check_password('456'))
+        u.refresh_from_db()
+        self.assertTrue(u.check_password('456'))
+        self.assertEqual(u.email, 'b@qq.com')
+
+        # 延迟加载的字段
+        u = User.objects.only('username').get(username='abc')
+        self.assertEqual(u.get_dirty_fields(), [])
+        u.email = 'c@qq.com'
+        self.assertEqual(u.get_dirty_fields(), ['email'])
+        u.save()
+        self.assertTrue(User.objects.get(username='abc').check_password('456'))
+
+    def test_dirty_fields_partial_save(self):
+        User.objects.create(username='abc', password='123', email='a@qq.com')
+        u = User.objects.get(username='abc')
+
+        # 指定 update_fields 时，未写入的字段仍被视为已修改
+        u.email = 'b@qq.com'
+        u.username = 'def'
+        u.save(update_fields=['email'])
+        self.assertEqual(u.get_dirty_fields(), ['username'])
+        self.assertEqual(User.objects.get(pk=u.pk).username, 'abc')
+
+        u.save()
+        self.assertEqual(u.get_dirty_fields(), [])
+        u = User.objects.get(pk=u.pk)
+        self.assertEqual((u.username, u.email), ('def', 'b@qq.com'))
+
+
+class PasswordRehashTest(TestCase):
+    """登陆后重新计算哈希测试"""
+
+    test_user_data = {
+        'username': '123',
+        'email': 'a@b.com',
+        'password': password_encode('12345678'),
+    }
+
+    def test_needs_rehash(self):
+        hashed = hashing.hashpw('a', 4, b'2b')
+        self.assertEqual(hashing.parse_hash(hashed), (b'2b', 4))
+        self.assertEqual(hashing.parse_hash('not a hash'), (None, None))
+        self.assertFalse(hashing.needs_rehash(hashed, 4, b'2b'))
+        self.assertTrue(hashing.needs_rehash(hashed, 5, b'2b'))
+        self.assertTrue(hashing.needs_rehash(hashed, 4, b'2a'))
+
+    def test_rehash_on_login(self):
+        with override_settings(SHOP_PASSWORD_ROUNDS=4):
+            user = User.objects.create(**self.test_user_data)
+
+        with override_settings(SHOP_PASSWORD_ROUNDS=5):
+            # 登陆成功后在事务提交时安排重新计算
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(reverse('shop:login'), data=self.test_user_data)
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(len(callbacks), 1)
+
+            old_password = user.password
+            self.assertTrue(models.rehash_password(user.pk, self.test_user_data['password'], old_password))
+            user.refresh_from_db()
+            self.assertEqual(hashing.parse_hash(user.password), (b'2b', 5))
+            self.assertTrue(user.check_password(self.test_user_data['password']))
+
+            # 期间密码已被修改时不覆盖
+            self.assertFalse(models.rehash_password(user.pk, self.test_user_data['password'], old_password))
+
+            # 轮数相同或密码错误时不重新计算
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.assertTrue(user.check_password(self.test_user_data['password']))
+                self.assertFalse(user.check_password(password_encode('wrong')))
+            self.assertEqual(len(callbacks), 0)
+
+    def test_calibrate(self):
+        out = StringIO()
+        call_command('calibrate_bcrypt', min_rounds=4, max_rounds=5, samples=1, target_ms=10000, stdout=out)
+        self.assertIn('推荐轮数：5', out.getvalue())
+
+
+class UserTypeCacheTest(TestCase):
+    """用户类型缓存测试"""
+
+    def tearDown(self):
+        clear_usertype_cache()
+
+    def test_cached_usertype(self):
+        expected = {t.typename: t.id for t in UserType.objects.all()}
+
+        clear_usertype_cache()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_usertype_id('normal'), expected['normal'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_usertype_id('seller'), expected['seller'])
+            self.assertEqual(get_usertype_id('admin'), expected['admin'])
+
+        with self.assertRaises(UserType.DoesNotExist):
+            get_usertype_id('vip')
+
+    def test_invalidation(self):
+        get_usertype_ids()
+
+        # 新增用户类型后缓存失效
+        vip = UserType.objects.create(typename='vip')
+        self.assertEqual(get_usertype_id('vip'), vip.id)
+
+        # 修改用户类型后缓存失效
+        vip.typename = 'svip'
+        vip.save()
+        self.assertEqual(get_usertype_id('svip'), vip.id)
+        self.assertNotIn('vip', get_usertype_ids())
+
+        # 删除用户类型后缓存失效
+        vip.delete()
+        self.assertNotIn('svip', get_usertype_ids())
+
+    def test_center_enter(self):
+        password = password_encode('12345678')
+        for typename in ['normal', 'seller', 'admin']:
+            user = User.objects.create(username=typename, password=password, email=f'{typename}@b.com',
+                                       type_id=get_usertype_id(typename))
+            self.client.post(reverse('shop:login'), data={'username': user.username, 'password': password})
+
+            response = self.client.get(reverse('shop:center'))
+            self.assertRedirects(response, reverse('shop:member_info'), fetch_redirect_response=False)
+            self.client.get(reverse('shop:logout'))
+
+
+class PasswordHasherTest(TestCase):
+    """密码哈希服务测试"""
+
+    def test_hash_and_check(self):
+        hasher = PasswordHasher(workers=2, max_pending=2)
+        hashed = hasher.hash('12345678', 4, b'2b')
+        self.assertTrue(hashed.startswith('$2b$04$'))
+        self.assertTrue(hasher.check('12345678', hashed))
+        self.assertFalse(hasher.check('87654321', hashed))
+        with self.assertRaises(ValueError):
+            hasher.check('12345678', 'not-a-hash')
+        hasher.shutdown()
+
+    def test_bounded_queue(self):
+        hasher = PasswordHasher(workers=1, max_pending=1, timeout=0.1)
+        release = threading.Event()
+
+        # 一个任务正在计算，一个任务在排队，第三个任务被立即拒绝
+        running = hasher.submit(release.wait)
+        pending = hasher.submit(release.wait)
+        with self.assertRaises(PasswordHasherBusy):
+            hasher.submit(release.wait)
+
+        # 等待超时
+        with self.assertRaises(PasswordHasherBusy):
+            hasher._result(pending)
+
+        release.set()
+        running.result()
+        pending.result()
+        self.assertTrue(hasher.check('12345678', hasher.hash('12345678', 4, b'2b')))
+        hasher.shutdown()
+
+    def test_busy_login(self):
+        data = {
+            'username': '123',
+            'email': 'a@b.com',
+            'password': password_encode('12345678'),
+        }
+        User.objects.create(**data)
+
+        busy_hasher = PasswordHasher(workers=1, max_pending=0)
+        release = threading.Event()
+        busy_hasher.submit(release.wait)
+        try:
+            with mock.patch('shop.hashing.get_hasher', return_value=busy_hasher):
+                response = self.client.post(reverse('shop:login'), data=data)
+        finally:
+            release.set()
+            busy_hasher.shutdown()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '服务器繁忙，请稍后再试')
+
 
 class GoodsModelTest(TestCase):
     """商品模型测试"""
@@ -29,7 +309,7 @@ class GoodsModelTest(TestCase):
         self.assertIn(g, Goods.objects.all())
 
 
-class GoodsListViewTest(TestCase):
+class GoodsListViewTest(QueryBudgetMixin, TestCase):
     """商品列表视图测试"""
 
     url = reverse('shop:goods_list')
@@ -80,6 +360,49 @@ class GoodsListViewTest(TestCase):
         self.assertNotContains(response3, g3.goods_name)
         self.assertContains(response3, 'sorry，未搜索到合适的内容。')
 
+    def test_price_filter_and_sort(self):
+        u1 = User.objects.create(username='abc', password='123', email='a@qq.com')
+        u2 = User.objects.create(username='def', password='123', email='b@qq.com')
+        prices = ['5.00', '3.00', '3.00', '8.00', '1.00', '3.00', '5.00', '9.90']
+        goods = [Goods.objects.create(goods_name=f'商品{i}', seller=u1 if i % 2 else u2, price=price)
+                 for i, price in enumerate(prices)]
+
+        def pages(params):
+            result = []
+            with self.settings(SHOP_FRAGMENT_CACHE_TIMEOUT=0):
+                response = self.client.get(self.url, params)
+                while True:
+                    self.assertEqual(response.status_code, 200)
+                    page = response.context['page_obj']
+                    result.extend(page.object_list)
+                    if not page.has_next():
+                        return result
+                    response = self.client.get(self.url, dict(params, c=page.next_cursor))
+
+        with mock.patch.object(GoodsListView, 'paginate_by', 3):
+            self.assertEqual(pages({'sort': 'price'}), sorted(goods, key=lambda g: (g.price, g.pk)))
+            self.assertEqual(pages({'sort': '-price'}), sorted(goods, key=lambda g: (g.price, g.pk), reverse=True))
+            self.assertEqual(pages({'sort': 'newest'}), goods[::-1])
+
+            # 按价格区间过滤时默认按价格排序
+            self.assertEqual(pages({'min_price': '3', 'max_price': '5.00'}),
+                             [goods[1], goods[2], goods[5], goods[0], goods[6]])
+            # 与商家过滤组合
+            self.assertEqual(pages({'s': u1.pk, 'max_price': '4', 'sort': '-price'}), [goods[5], goods[1]])
+
+        response = self.client.get(self.url, {'min_price': '3', 'sort': '-price'})
+        self.assertContains(response, 'value="3"')
+        self.assertContains(response, '<option value="-price" selected>')
+
+        # 参数错误或游标来自其他排序方式
+        for params in [{'sort': 'name'}, {'min_price': 'abc'}, {'max_price': 'inf'}, {'s': 'x'},
+                       {'s': '99999999999999999999999'}, {'sort': 'newest', 'min_price': '3'},
+                       {'sort': 'newest', 's': u1.pk, 'max_price': '4'}]:
+            self.assertEqual(self.client.get(self.url, params).status_code, 404)
+        with mock.patch.object(GoodsListView, 'paginate_by', 3):
+            cursor = self.client.get(self.url, {'sort': 'price'}).context['page_obj'].next_cursor
+        self.assertEqual(self.client.get(self.url, {'sort': '-price', 'c': cursor}).status_code, 404)
+
     def test_seller_filter(self):
         u1 = User.objects.create(username='abc', password='123', email='a@qq.com')
         g1 = Goods.objects.create(goods_name='联想ThinkPad X390', seller=u1, price=5999.99)
@@ -141,8 +464,649 @@ class GoodsListViewTest(TestCase):
         })
         self.assertEquals(response4.status_code, 404)
 
+    def test_cursor_pagination(self):
+        u1 = User.objects.create(username='abc', password='123', email='a@qq.com')
+        u2 = User.objects.create(username='def', password='456', email='b@qq.com')
+        goods = [Goods.objects.create(goods_name=f'商品{i:02d}', seller=u1 if i % 3 else u2, price=i)
+                 for i in range(45)]
+        page_size = 20
+
+        # 第一页
+        response1 = self.client.get(self.url)
+        page1 = response1.context['page_obj']
+        self.assertEqual(list(response1.context['goods_list']), goods[:page_size])
+        self.assertFalse(page1.has_previous())
+        self.assertTrue(page1.has_next())
+        self.assertContains(response1, '下一页')
+        self.assertNotContains(response1, '上一页')
+
+        # 第二页
+        response2 = self.client.get(self.url, data={'c': page1.next_cursor})
+        page2 = response2.context['page_obj']
+        self.assertEqual(list(response2.context['goods_list']), goods[page_size:page_size * 2])
+        self.assertTrue(page2.has_previous())
+        self.assertTrue(page2.has_next())
+
+        # 最后一页
+        response3 = self.client.get(self.url, data={'c': page2.next_cursor})
+        page3 = response3.context['page_obj']
+        self.assertEqual(list(response3.context['goods_list']), goods[page_size * 2:])
+        self.assertFalse(page3.has_next())
+        self.assertNotContains(response3, '下一页')
+
+        # 从最后一页返回上一页
+        response4 = self.client.get(self.url, data={'c': page3.previous_cursor})
+        self.assertEqual(list(response4.context['goods_list']), goods[page_size:page_size * 2])
+
+        # 分页与商家过滤共同使用
+        seller_goods = [g for g in goods if g.seller == u1]
+        response5 = self.client.get(self.url, data={'s': u1.id})
+        page5 = response5.context['page_obj']
+        self.assertContains(response5, f's={u1.id}&amp;c={page5.next_cursor}')
+        response6 = self.client.get(self.url, data={'s': u1.id, 'c': page5.next_cursor})
+        self.assertEqual(list(response6.context['goods_list']), seller_goods[page_size:])
+        self.assertFalse(response6.context['page_obj'].has_next())
+
+        # 缓存键以外的参数不写入翻页链接，否则会随缓存的页面片段返回给其他请求
+        cache.clear()
+        response7 = self.client.get(self.url, data={'s': u1.id, 'utm_source': 'ad'})
+        self.assertContains(response7, f'?s={u1.id}&amp;c={page5.next_cursor}')
+        self.assertNotContains(response7, 'utm_source')
+
+        # 无效的游标
+        response8 = self.client.get(self.url, data={'c': 'abc'})
+        self.assertEqual(response8.status_code, 404)
+
+        # 被篡改的游标
+        for values in [['abc'], [None]]:
+            response = self.client.get(self.url, {'c': encode_cursor(values, ordering=('pk',))})
+            self.assertEqual(response.status_code, 404)
+
+    def test_query_budget(self):
+        sellers = [User.objects.create(username=f'seller{i}', password='123', email=f'{i}@qq.com') for i in range(3)]
+        for i in range(15):
+            Goods.objects.create(goods_name=f'商品{i}', seller=sellers[i % 3], price=i, description='一些奇奇怪怪的描述')
+
+        # 商品列表与商家一次查询取出，且不读取商品描述；缩略图一次查询取出
+        with self.assertQueryBudget(2) as context:
+            response1 = self.client.get(self.url)
+        for seller in sellers:
+            self.assertContains(response1, seller.username)
+        self.assertNotIn('"description"', context.captured_queries[0]['sql'])
+
+        # 商家过滤额外查询一次商家信息
+        with self.assertQueryBudget(3):
+            response2 = self.client.get(self.url, data={'s': sellers[0].id})
+        self.assertContains(response2, sellers[0].username)
+
+
+class CursorPaginatorTest(TestCase):
+    """游标分页器测试"""
+
+    def test_cursor_encoding(self):
+        cursor = encode_cursor(['9.90', 12], reverse=True)
+        self.assertEqual(decode_cursor(cursor), (['9.90', 12], True))
+
+        for invalid in ['abc', encode_cursor(None), '!!!']:
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(invalid)
+
+    def test_multi_field_ordering(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        prices = [5, 3, 3, 8, 1, 3, 5]
+        for i, price in enumerate(prices):
+            Goods.objects.create(goods_name=f'商品{i}', seller=u, price=price)
+        expected = list(Goods.objects.order_by('-price', 'pk'))
+
+        paginator = CursorPaginator(Goods.objects.all(), ('-price', 'pk'), per_page=3)
+        result = []
+        page = paginator.page()
+        while True:
+            result.extend(page.object_list)
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_cursor)
+        self.assertEqual(result, expected)
+
+        # 反向翻页
+        previous = paginator.page(page.previous_cursor)
+        self.assertEqual(previous.object_list, expected[3:6])
+
+        # 游标与排序字段数量不一致
+        with self.assertRaises(InvalidCursor):
+            paginator.page(encode_cursor([1], ordering=('-price', 'pk')))
+
+        # 被篡改的游标
+        for values in [['abc', 1], [None, 1], ['9.90', None], ['NaN', 1], [[1], 1], ['9.90', 'x'], [{}, 1]]:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(encode_cursor(values, ordering=('-price', 'pk')))
+        self.assertEqual(paginator.page(encode_cursor(['5', '3'], ordering=('-price', 'pk'))).values,
+                         [Decimal('5'), 3])
+
+        # 按其他排序方式生成的游标
+        with self.assertRaises(InvalidCursor):
+            CursorPaginator(Goods.objects.all(), ('price', 'pk'), per_page=3).page(page.previous_cursor)
+
+
+class SellerSummaryTest(TestCase):
+    """商家汇总数据测试"""
+
+    def setUp(self):
+        self.u1 = User.objects.create(username='abc', password='123', email='a@qq.com')
+        self.u2 = User.objects.create(username='def', password='123', email='b@qq.com')
+
+    def assertSummary(self, seller, goods_count, min_price, max_price):
+        summary = SellerSummary.objects.get(seller=seller)
+        self.assertEqual((summary.goods_count, summary.min_price, summary.max_price),
+                         (goods_count, min_price, max_price))
+        self.assertEqual(SellerSummary.aggregate(seller.pk), (goods_count, min_price, max_price))
+
+    def test_incremental(self):
+        g1 = Goods.objects.create(goods_name='a', seller=self.u1, price='5.00')
+        self.assertSummary(self.u1, 1, Decimal('5.00'), Decimal('5.00'))
+        g2 = Goods.objects.create(goods_name='b', seller=self.u1, price=10)
+        g3 = Goods.objects.create(goods_name='c', seller=self.u1, price=Decimal('2.50'))
+        self.assertSummary(self.u1, 3, Decimal('2.50'), Decimal('10.00'))
+
+        # 修改最低价商品的价格
+        g3.price = Decimal('7.00')
+        g3.save()
+        self.assertSummary(self.u1, 3, Decimal('5.00'), Decimal('10.00'))
+
+        # 修改其他字段时不更新（只有商品和检索索引的查询）
+        g1 = Goods.objects.get(pk=g1.pk)
+        with self.assertNumQueries(3):
+            g1.goods_name = 'aa'
+            g1.save()
+
+        # 更换商家
+        g2.seller = self.u2
+        g2.save()
+        self.assertSummary(self.u1, 2, Decimal('5.00'), Decimal('7.00'))
+        self.assertSummary(self.u2, 1, Decimal('10.00'), Decimal('10.00'))
+
+        # 延迟加载部分字段的商品
+        deferred = Goods.objects.only('price').get(pk=g3.pk)
+        deferred.price = Decimal('1.00')
+        deferred.save()
+        self.assertSummary(self.u1, 2, Decimal('1.00'), Decimal('5.00'))
+        deferred = Goods.objects.only('goods_name').get(pk=g3.pk)
+        deferred.price = Decimal('7.00')
+        deferred.save()
+        self.assertSummary(self.u1, 2, Decimal('5.00'), Decimal('7.00'))
+
+        # 删除
+        g1.delete()
+        self.assertSummary(self.u1, 1, Decimal('7.00'), Decimal('7.00'))
+        g3.delete()
+        self.assertSummary(self.u1, 0, None, None)
+
+        # 删除延迟加载部分字段的商品
+        Goods.objects.create(goods_name='d', seller=self.u1, price='3.00')
+        g5 = Goods.objects.create(goods_name='e', seller=self.u1, price='4.00')
+        Goods.objects.only('id').get(pk=g5.pk).delete()
+        self.assertSummary(self.u1, 1, Decimal('3.00'), Decimal('3.00'))
+        Goods.objects.only('id').filter(seller=self.u1).delete()
+        self.assertSummary(self.u1, 0, None, None)
+
+        # 删除商家时一并删除
+        self.u2.delete()
+        self.assertFalse(SellerSummary.objects.filter(seller_id=g2.seller_id).exists())
+
+    def test_storefront_header(self):
+        for price in ['1.00', '8.00', '3.00']:
+            Goods.objects.create(goods_name='a', seller=self.u1, price=price)
+
+        url = reverse('shop:goods_list')
+        response1 = self.client.get(url, {'s': self.u1.pk})
+        self.assertContains(response1, '3 件商品，1.00 ~ 8.00 元')
+        self.assertContains(response1, f'<a class="sub" href="{url}?s={self.u1.pk}">abc</a>', html=True)
+
+        # 汇总数据只查询一次，不再单独查询商家
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.get(url, {'s': self.u1.pk})
+        self.assertFalse([q for q in queries if 'FROM "shop_user"' in q['sql']])
+        self.assertEqual(len([q for q in queries if 'shop_sellersummary' in q['sql']]), 1)
+
+        # 没有商品的商家
+        response2 = self.client.get(url, {'s': self.u2.pk})
+        self.assertContains(response2, '0 件商品')
+        self.assertEqual(self.client.get(url, {'s': 999999}).status_code, 404)
+
+    def test_reconcile(self):
+        Goods.objects.create(goods_name='a', seller=self.u1, price='5.00')
+        # bulk_create 不发送信号
+        Goods.objects.bulk_create([Goods(goods_name='b', seller=self.u1, price='1.00'),
+                                   Goods(goods_name='c', seller=self.u2, price='9.00')])
+        SellerSummary.objects.create(seller=User.objects.create(username='ghi', email='c@qq.com'), goods_count=3)
+
+        out = StringIO()
+        call_command('reconcile_seller_summaries', stdout=out)
+        self.assertIn('新建 1 个，更新 1 个，删除 1 个', out.getvalue())
+        self.assertSummary(self.u1, 2, Decimal('1.00'), Decimal('5.00'))
+        self.assertSummary(self.u2, 1, Decimal('9.00'), Decimal('9.00'))
+        self.assertEqual(SellerSummary.objects.count(), 2)
+
+        self.assertEqual(SellerSummary.reconcile(), (0, 0, 0))
+
+
+class GoodsListCacheTest(QueryBudgetMixin, TestCase):
+    """商品列表片段缓存测试"""
+
+    url = reverse('shop:goods_list')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_cache(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        g = Goods.objects.create(goods_name='pc', seller=u, price=5999.99)
+
+        response1 = self.client.get(self.url)
+        self.assertContains(response1, g.goods_name)
+
+        # 缓存命中时不查询数据库
+        with self.assertQueryBudget(0):
+            response2 = self.client.get(self.url)
+        self.assertContains(response2, g.goods_name)
+
+        # 不同的过滤参数使用不同的缓存
+        response3 = self.client.get(self.url, data={'g': '什么什么'})
+        self.assertNotContains(response3, g.goods_name)
+
+        # 修改商品后缓存失效
+        g.goods_name = 'laptop'
+        g.save()
+        response4 = self.client.get(self.url)
+        self.assertContains(response4, 'laptop')
+
+        # 删除商品后缓存失效
+        g.delete()
+        response5 = self.client.get(self.url)
+        self.assertNotContains(response5, 'laptop')
+
+    def test_goods_card_cache(self):
+        u1 = User.objects.create(username='abc', password='123', email='a@qq.com')
+        u2 = User.objects.create(username='def', password='456', email='b@qq.com')
+        g1 = Goods.objects.create(goods_name='pc', seller=u1, price=5999.99)
+        g2 = Goods.objects.create(goods_name='phone', seller=u2, price=3999.99)
+        self.client.get(self.url)
+
+        # 修改商品只更新该商品的版本
+        g2_version = g2.version
+        g1.price = 4999.99
+        g1.save()
+        g2.refresh_from_db()
+        self.assertEqual(g2.version, g2_version)
+        self.assertContains(self.client.get(self.url), '4999.99')
+
+        # 商家改名后更新该商家所有商品的版本
+        g1_version = Goods.objects.get(pk=g1.pk).version
+        u1.username = 'xyz'
+        u1.save()
+        self.assertNotEqual(Goods.objects.get(pk=g1.pk).version, g1_version)
+        self.assertEqual(Goods.objects.get(pk=g2.pk).version, g2_version)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'xyz')
+        self.assertNotContains(response, '>abc<')
+
+        # 商家修改其他信息不影响商品的版本
+        u2.email = 'c@qq.com'
+        u2.save()
+        self.assertEqual(Goods.objects.get(pk=g2.pk).version, g2_version)
+
+    def test_shared_generation(self):
+        # 目录版本保存在共享的缓存中，清空进程内的缓存后保持不变
+        shared = caches[settings.SHOP_CATALOG_GENERATION_CACHE]
+        generation = caching.get_catalog_generation()
+        self.assertEqual(shared.get(caching.CATALOG_GENERATION_KEY), generation)
+        cache.clear()
+        self.assertEqual(caching.get_catalog_generation(), generation)
+
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        Goods.objects.create(goods_name='pc', seller=u, price=5999.99)
+        self.assertGreater(shared.get(caching.CATALOG_GENERATION_KEY), generation)
+
+
+class GoodsImageVariantTest(TestCase):
+    """商品图片缩略图测试"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    @staticmethod
+    def image_file(width, height, name='goods.png'):
+        buffer = BytesIO()
+        Image.new('RGBA', (width, height), (255, 0, 0, 128)).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_generate_variants(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+
+        # 上传图片后在事务提交时安排生成缩略图
+        with self.captureOnCommitCallbacks() as callbacks:
+            g = Goods.objects.create(goods_name='pc', seller=u, price=9.9, image=self.image_file(1000, 500))
+        self.assertEqual(len(callbacks), 1)
+
+        version = g.version
+        self.assertEqual(images.generate_image_variants(g.pk), 6)
+        variants = GoodsImageVariant.objects.filter(goods=g)
+        self.assertEqual(sorted(variants.values_list('width', 'format')),
+                         [(160, 'jpeg'), (160, 'webp'), (320, 'jpeg'), (320, 'webp'), (640, 'jpeg'), (640, 'webp')])
+        for variant in variants:
+            with Image.open(variant.image.path) as image:
+                self.assertEqual(image.size, (variant.width, variant.width // 2))
+                self.assertEqual(image.format, variant.format.upper())
+        g.refresh_from_db()
+        self.assertNotEqual(g.version, version)
+
+        # 列表和详情页面输出 srcset
+        response1 = self.client.get(reverse('shop:goods_list'))
+        self.assertContains(response1, '<source type="image/webp"')
+        self.assertContains(response1, f'{variants.get(width=160, format="jpeg").image.url} 160w')
+        response2 = self.client.get(reverse('shop:goods_detail', kwargs={'pk': g.pk}))
+        self.assertContains(response2, f'{variants.get(width=640, format="webp").image.url} 640w')
+        self.assertContains(response2, g.image.url)
+
+        # 更换图片后旧的缩略图立即失效，并重新安排生成缩略图
+        paths = [v.image.path for v in variants]
+        url = variants.get(width=160, format='jpeg').image.url
+        version = g.version
+        g.image = self.image_file(800, 400, name='other.png')
+        with self.captureOnCommitCallbacks() as callbacks:
+            g.save()
+        self.assertEqual(len(callbacks), 2)
+        self.assertNotEqual(g.version, version)
+        self.assertFalse(GoodsImageVariant.objects.filter(goods=g).exists())
+        self.assertNotContains(self.client.get(reverse('shop:goods_list')), url)
+        # 第一个回调删除旧缩略图文件，第二个回调安排生成新的缩略图
+        callbacks[0]()
+        self.assertFalse(any(os.path.exists(p) for p in paths))
+
+        # 删除图片后缩略图随之删除
+        self.assertEqual(images.generate_image_variants(g.pk), 6)
+        paths = [v.image.path for v in GoodsImageVariant.objects.filter(goods=g)]
+        with self.captureOnCommitCallbacks(execute=True):
+            g.image = None
+            g.save()
+        self.assertFalse(GoodsImageVariant.objects.filter(goods=g).exists())
+        self.assertFalse(any(os.path.exists(p) for p in paths))
+
+    def test_delete_goods(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        g = Goods.objects.create(goods_name='pc', seller=u, price=9.9, image=self.image_file(1000, 500))
+        images.generate_image_variants(g.pk)
+        paths = [v.image.path for v in GoodsImageVariant.objects.filter(goods=g)]
+        self.assertTrue(all(os.path.exists(p) for p in paths))
+
+        # 详情页面预取缩略图，不随缩略图数量增加查询
+        with self.assertNumQueries(3):
+            self.client.get(reverse('shop:goods_detail', kwargs={'pk': g.pk}))
+
+        # 删除商品后在事务提交时删除缩略图文件
+        with self.captureOnCommitCallbacks(execute=True):
+            g.delete()
+        self.assertFalse(any(os.path.exists(p) for p in paths))
+
+    def test_small_image(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        g = Goods.objects.create(goods_name='pc', seller=u, price=9.9, image=self.image_file(100, 100))
+
+        # 不放大比缩略图更小的图片
+        call_command('build_image_variants', stdout=StringIO())
+        self.assertEqual(sorted(GoodsImageVariant.objects.filter(goods=g).values_list('width', 'format')),
+                         [(100, 'jpeg'), (100, 'webp')])
+
+
+class MediaServingTest(TestCase):
+    """媒体文件服务测试"""
+
+    content = b'0123456789abcdef'
+    immutable_name = 'shop/image/goods/0123456789abcdef0123456789abcdef.png'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        for name in [self.immutable_name, 'other.txt']:
+            fullpath = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+            with open(fullpath, 'wb') as f:
+                f.write(self.content)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def get(self, name, **extra):
+        return self.client.get(f'/media/{name}', **extra)
+
+    def test_full_file(self):
+        response1 = self.get(self.immutable_name)
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(b''.join(response1.streaming_content), self.content)
+        self.assertEqual(response1['Content-Length'], str(len(self.content)))
+        self.assertEqual(response1['Content-Type'], 'image/png')
+        self.assertEqual(response1['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response1['Cache-Control'])
+
+        # 非 uuid 命名的文件不使用 immutable 缓存
+        response2 = self.get('other.txt')
+        self.assertNotIn('immutable', response2['Cache-Control'])
+
+        # 文件不存在或路径越界
+        self.assertEqual(self.get('missing.png').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+        self.assertEqual(self.get('shop').status_code, 404)
+
+    def test_conditional(self):
+        response1 = self.get(self.immutable_name)
+
+        response2 = self.get(self.immutable_name, HTTP_IF_MODIFIED_SINCE=response1['Last-Modified'])
+        self.assertEqual(response2.status_code, 304)
+
+        response3 = self.get(self.immutable_name, HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response3.status_code, 304)
+
+        response4 = self.get(self.immutable_name, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response4.status_code, 200)
+
+    def test_range(self):
+        response1 = self.get(self.immutable_name, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response1.status_code, 206)
+        self.assertEqual(b''.join(response1.streaming_content), b'2345')
+        self.assertEqual(response1['Content-Range'], f'bytes 2-5/{len(self.content)}')
+        self.assertEqual(response1['Content-Length'], '4')
+
+        # 到文件末尾
+        response2 = self.get(self.immutable_name, HTTP_RANGE='bytes=10-')
+        self.assertEqual(b''.join(response2.streaming_content), b'abcdef')
+
+        # 最后 N 个字节
+        response3 = self.get(self.immutable_name, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response3.streaming_content), b'def')
+
+        # 范围无效
+        response4 = self.get(self.immutable_name, HTTP_RANGE='bytes=100-200')
+        self.assertEqual(response4.status_code, 416)
+        self.assertEqual(response4['Content-Range'], f'bytes */{len(self.content)}')
+
+        # 多个范围或 If-Range 不匹配时返回完整文件
+        response5 = self.get(self.immutable_name, HTTP_RANGE='bytes=0-1,4-5')
+        self.assertEqual(response5.status_code, 200)
+        response6 = self.get(self.immutable_name, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response6.status_code, 200)
+
+        # 空文件没有可满足的范围
+        open(os.path.join(self.media_root, 'empty.txt'), 'wb').close()
+        for header in ['bytes=-3', 'bytes=0-']:
+            response7 = self.get('empty.txt', HTTP_RANGE=header)
+            self.assertEqual(response7.status_code, 416)
+            self.assertEqual(response7['Content-Range'], 'bytes */0')
+
+    def test_accel(self):
+        with override_settings(SHOP_MEDIA_ACCEL='x-accel-redirect', SHOP_MEDIA_ACCEL_PREFIX='/protected/'):
+            response1 = self.get(self.immutable_name)
+            # Range 请求同样交给前端代理处理
+            response3 = self.get(self.immutable_name, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(response1.content, b'')
+        self.assertEqual(response1['X-Accel-Redirect'], f'/protected/{self.immutable_name}')
+        self.assertIn('immutable', response1['Cache-Control'])
+        self.assertEqual(response3.status_code, 200)
+        self.assertEqual(response3['X-Accel-Redirect'], f'/protected/{self.immutable_name}')
+
+        with override_settings(SHOP_MEDIA_ACCEL='x-sendfile'):
+            response2 = self.get('other.txt')
+        self.assertEqual(response2['X-Sendfile'], os.path.join(self.media_root, 'other.txt'))
+
+
+class StaticPipelineTest(TestCase):
+    """静态文件哈希与预压缩测试"""
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            STATIC_ROOT=self.static_root, STATICFILES_STORAGE='shop.storage.CompressedManifestStaticFilesStorage')
+        self.settings_override.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as f:
+            self.css_name = json.load(f)['paths']['shop/css/style.css']
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.static_root, ignore_errors=True)
+
+    def test_collectstatic(self):
+        self.assertRegex(self.css_name, r'^shop/css/style\.[0-9a-f]{12}\.css$')
+
+        css_path = os.path.join(self.static_root, self.css_name)
+        with open(css_path, 'rb') as f:
+            content = f.read()
+        with open(css_path + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), content)
+        try:
+            import brotli
+        except ImportError:
+            self.assertFalse(os.path.exists(css_path + '.br'))
+        else:
+            with open(css_path + '.br', 'rb') as f:
+                self.assertEqual(brotli.decompress(f.read()), content)
+
+        # 图片不压缩
+        self.assertFalse(any(name.endswith('.png.gz') for name in os.listdir(
+            os.path.join(self.static_root, 'shop', 'image'))))
+
+        # 模板中引用的文件不存在时报错，不静默使用原文件名
+        self.assertEqual(static('shop/css/style.css'), f'/static/{self.css_name}')
+        with self.assertRaises(ValueError):
+            static('shop/css/missing.css')
+
+    def test_serve(self):
+        with open(os.path.join(self.static_root, self.css_name), 'rb') as f:
+            content = f.read()
+
+        response1 = self.client.get(f'/static/{self.css_name}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(response1['Content-Encoding'], 'gzip')
+        self.assertEqual(response1['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response1['Vary'])
+        self.assertIn('immutable', response1['Cache-Control'])
+        self.assertEqual(gzip.decompress(b''.join(response1.streaming_content)), content)
+
+        # 不接受压缩时返回原文件
+        response2 = self.client.get(f'/static/{self.css_name}', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response2.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response2.streaming_content), content)
+
+        # 不带哈希的文件名不使用 immutable 缓存
+        response3 = self.client.get('/static/shop/css/style.css')
+        self.assertEqual(response3.status_code, 200)
+        self.assertNotIn('immutable', response3['Cache-Control'])
+
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 404)
+
+        # 交给前端代理发送预压缩文件
+        with override_settings(SHOP_MEDIA_ACCEL='x-accel-redirect', SHOP_STATIC_ACCEL_PREFIX='/protected-static/'):
+            response4 = self.client.get(f'/static/{self.css_name}', HTTP_ACCEPT_ENCODING='gzip',
+                                        HTTP_RANGE='bytes=0-1')
+        self.assertEqual(response4.status_code, 200)
+        self.assertEqual(response4['X-Accel-Redirect'], f'/protected-static/{self.css_name}.gz')
+        self.assertEqual(response4['Content-Encoding'], 'gzip')
+        self.assertEqual(response4['Content-Type'], 'text/css')
+
+
+class GoodsSearchTest(TestCase):
+    """商品全文检索测试"""
+
+    url = reverse('shop:goods_list')
+
+    def search(self, keywords):
+        response = self.client.get(self.url, data={'g': keywords})
+        return [g.goods_name for g in response.context['goods_list']]
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize('2019新品天王表'),
+                         ['2019', '新', '品', '天', '王', '表', '新品', '品天', '天王', '王表'])
+        self.assertEqual(search.tokenize('联想ThinkPad X390'), ['联', '想', '联想', 'thinkpad', 'x390'])
+        self.assertEqual(search.build_match_query('天王表 Think'), '"天王" AND "王表" AND "think"*')
+        self.assertEqual(search.build_match_query('表'), '"表"')
+        self.assertIsNone(search.build_match_query('!!!'))
+
+    def test_ranked_search(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        Goods.objects.create(goods_name='机械键盘', seller=u, price=299, description='适合搭配天王表使用')
+        Goods.objects.create(goods_name='2019新品天王表', seller=u, price=5999.99)
+        Goods.objects.create(goods_name='天王星望远镜', seller=u, price=999)
+
+        self.assertTrue(search.is_available())
+        # 名称命中的商品排在描述命中的商品之前，不连续的字不会被命中
+        self.assertEqual(self.search('天王表'), ['2019新品天王表', '机械键盘'])
+        self.assertEqual(self.search('望远'), ['天王星望远镜'])
+        self.assertEqual(self.search('王'), ['2019新品天王表', '天王星望远镜', '机械键盘'])
+
+        # 检索词只匹配一次，相关度取自同一次匹配
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.search('天王表')
+        sql = [q['sql'] for q in queries if search.INDEX_TABLE in q['sql']]
+        self.assertEqual(len(sql), 1)
+        self.assertEqual(sql[0].count('MATCH'), 1)
+
+    def test_index_sync(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        g = Goods.objects.create(goods_name='联想ThinkPad X390', seller=u, price=5999.99)
+        self.assertEqual(self.search('thinkpad'), [g.goods_name])
+
+        # 修改商品后索引随之更新
+        g.goods_name = '华为MateBook'
+        g.save()
+        self.assertEqual(self.search('thinkpad'), [])
+        self.assertEqual(self.search('华为'), [g.goods_name])
+
+        # 删除商品后索引随之删除
+        g.delete()
+        self.assertEqual(self.search('华为'), [])
+
+        # 批量更新不会触发信号，需要重建索引
+        Goods.objects.bulk_create([Goods(goods_name=f'天王表{i}', seller=u, price=i) for i in range(30)])
+        self.assertEqual(self.search('天王'), [])
+        call_command('rebuild_goods_index', stdout=StringIO())
+        response = self.client.get(self.url, data={'g': '天王'})
+        self.assertEqual(len(response.context['goods_list']), 20)
+
+        # 检索结果可以继续翻页
+        response = self.client.get(self.url, data={'g': '天王', 'c': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(response.context['goods_list']), 10)
+
 
-class GoodsDetailViewTest(TestCase):
+class GoodsDetailViewTest(QueryBudgetMixin, TestCase):
     """商品详情视图测试"""
 
     def test_base_object_show(self):
@@ -171,6 +1135,79 @@ class GoodsDetailViewTest(TestCase):
         self.assertContains(response1, g.image.url)
         self.assertContains(response1, g.description)
 
+    def test_query_budget(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        g = Goods.objects.create(goods_name='pc', seller=u, price=9.9, description='一些奇奇怪怪的描述')
+
+        # 一次查询商品版本用于条件请求，一次查询取出商品与商家，一次预取缩略图
+        with self.assertQueryBudget(3):
+            response = self.client.get(reverse('shop:goods_detail', kwargs={'pk': g.id}))
+        self.assertContains(response, u.username)
+        self.assertContains(response, g.description)
+
+    def test_conditional_get(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        g = Goods.objects.create(goods_name='pc', seller=u, price=9.9)
+        url = reverse('shop:goods_detail', kwargs={'pk': g.id})
+
+        response1 = self.client.get(url)
+        self.assertEqual(response1.status_code, 200)
+        etag = response1['ETag']
+        last_modified = response1['Last-Modified']
+        self.assertEqual(etag, f'"{g.version.hex}-0"')
+
+        # 缓存有效时返回 304 ，只查询商品版本，不渲染模板
+        with self.assertQueryBudget(1):
+            response2 = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response2.status_code, 304)
+        self.assertEqual(response2.templates, [])
+
+        response3 = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response3.status_code, 304)
+
+        # 商品被修改后缓存失效
+        g.goods_name = 'laptop'
+        g.save()
+        response4 = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response4.status_code, 200)
+        self.assertContains(response4, 'laptop')
+        self.assertNotEqual(response4['ETag'], etag)
+
+        # 商家改名后缓存失效
+        u.username = 'xyz'
+        u.save()
+        response5 = self.client.get(url, HTTP_IF_NONE_MATCH=response4['ETag'])
+        self.assertEqual(response5.status_code, 200)
+        self.assertContains(response5, 'xyz')
+
+        # 商品不存在
+        response6 = self.client.get(reverse('shop:goods_detail', kwargs={'pk': 99999}), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response6.status_code, 404)
+
+    def test_conditional_get_user(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        g = Goods.objects.create(goods_name='pc', seller=u, price=9.9)
+        url = reverse('shop:goods_detail', kwargs={'pk': g.id})
+        guest_response = self.client.get(url)
+
+        # 登陆后页面头部变化，访客页面的缓存失效；登陆用户的页面只由 ETag 判断
+        session = self.client.session
+        session['user_id'] = u.pk
+        session.save()
+        response1 = self.client.get(url, HTTP_IF_NONE_MATCH=guest_response['ETag'],
+                                    HTTP_IF_MODIFIED_SINCE=guest_response['Last-Modified'])
+        self.assertEqual(response1.status_code, 200)
+        self.assertNotIn('Last-Modified', response1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response1['ETag']).status_code, 304)
+        response2 = self.client.get(url, HTTP_IF_MODIFIED_SINCE=guest_response['Last-Modified'])
+        self.assertEqual(response2.status_code, 200)
+
+        # 当前用户改名后缓存失效
+        User.objects.filter(pk=u.pk).update(username='xyz')
+        response3 = self.client.get(url, HTTP_IF_NONE_MATCH=response1['ETag'])
+        self.assertEqual(response3.status_code, 200)
+        self.assertContains(response3, 'xyz')
+
 
 class RegisterFEFormTest(TestCase):
     """前端注册表单测试"""
@@ -549,6 +1586,44 @@ class RegisterViewTest(TestCase):
         self.client.cookies.clear()
         User.objects.all().delete()
 
+    def test_conflict(self):
+        User.objects.create(username='123', password='12345678', email='a@b.com')
+        data = {
+            'username': '123',
+            'email': 'c@d.com',
+            'password': password_encode('12345678'),
+            'password_again': password_encode('12345678'),
+        }
+
+        # 用户名已被使用：只执行一次插入，不预先查询
+        with CaptureQueriesContext(connections['default']) as queries:
+            response1 = self.client.post(self.url, data=data)
+        user_queries = [q['sql'] for q in queries if '"shop_user"' in q['sql']]
+        self.assertEqual(len(user_queries), 1)
+        self.assertTrue(user_queries[0].startswith('INSERT'))
+        self.assertEqual(response1.context['form'].errors['username'], ['该用户名已被使用'])
+
+        # 邮箱已被使用（不区分大小写）
+        response2 = self.client.post(self.url, data=dict(data, username='456', email='A@B.com'))
+        self.assertEqual(response2.context['form'].errors['email'], ['该邮箱已被使用'])
+        self.assertEqual(User.objects.count(), 1)
+
+        # 成功
+        response3 = self.client.post(self.url, data=dict(data, username='456'))
+        self.assertEqual(response3.status_code, 302)
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_unique_error_field(self):
+        # 模拟 psycopg2 的异常，约束名称在 diag 中
+        cause = Exception('duplicate key value violates unique constraint')
+        cause.diag = mock.Mock(constraint_name='shop_user_username_key')
+        error = IntegrityError(str(cause))
+        error.__cause__ = cause
+        self.assertEqual(unique_error_field(User, error), 'username')
+        self.assertEqual(unique_error_field(User, IntegrityError('UNIQUE constraint failed: shop_user.username')),
+                         'username')
+        self.assertIsNone(unique_error_field(User, IntegrityError('NOT NULL constraint failed')))
+
     def test_invalid_username(self):
         data = {
             'email': 'a@b.com',
@@ -804,6 +1879,121 @@ class LoginViewTest(TestCase):
         self.assertEqual(response3.status_code, 302)
 
 
+class ThrottlingTest(TestCase):
+    """密码相关请求的准入控制测试"""
+
+    url = reverse('shop:login')
+    test_user_data = {
+        'username': '123',
+        'email': 'a@b.com',
+        'password': password_encode('12345678'),
+    }
+
+    def test_take_token(self):
+        self.assertTrue(throttling.take_token('ip:1', 2, 60, now=0))
+        self.assertTrue(throttling.take_token('ip:1', 2, 60, now=0))
+        self.assertFalse(throttling.take_token('ip:1', 2, 60, now=0))
+        self.assertTrue(throttling.take_token('ip:2', 2, 60, now=0))
+        # 30 秒补充一个令牌
+        self.assertTrue(throttling.take_token('ip:1', 2, 60, now=30))
+        self.assertFalse(throttling.take_token('ip:1', 2, 60, now=30))
+        # 令牌数量不超过容量
+        self.assertTrue(throttling.take_token('ip:1', 2, 60, now=1000))
+        self.assertEqual(ThrottleBucket.objects.get(key='ip:1').tokens, 1)
+
+        # 已补满的令牌桶可以删除
+        self.assertEqual(throttling.clear_idle_buckets(now=1000), 1)
+        self.assertEqual(list(ThrottleBucket.objects.values_list('key', flat=True)), ['ip:1'])
+
+        # 其他进程在第一次扣减之后创建了令牌桶，创建失败时扣减其中的令牌
+        ThrottleBucket.objects.create(key='ip:3', tokens=2, updated=0)
+        update = QuerySet.update
+
+        def racing_update(queryset, **kwargs):
+            racing_update.calls += 1
+            return 0 if racing_update.calls == 1 else update(queryset, **kwargs)
+        racing_update.calls = 0
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=racing_update):
+            self.assertTrue(throttling.take_token('ip:3', 2, 60, now=0))
+        self.assertEqual(ThrottleBucket.objects.get(key='ip:3').tokens, 1)
+
+    def test_acquire_lease(self):
+        lease1 = throttling.acquire_lease(2, 30, now=0)
+        lease2 = throttling.acquire_lease(2, 30, now=0)
+        self.assertIsNotNone(lease1)
+        self.assertIsNotNone(lease2)
+        # 超出上限时不保留新的租约
+        self.assertIsNone(throttling.acquire_lease(2, 30, now=0))
+        self.assertEqual(PasswordCheckLease.objects.count(), 2)
+        # 过期的租约被删除
+        self.assertIsNotNone(throttling.acquire_lease(2, 30, now=31))
+        self.assertEqual(PasswordCheckLease.objects.count(), 1)
+
+    @override_settings(SHOP_PASSWORD_THROTTLE={'USERNAME_RATE': (2, 60)})
+    def test_login_throttled(self):
+        User.objects.create(**self.test_user_data)
+        data = dict(self.test_user_data, password=password_encode('wrong'))
+
+        hasher = hashing.get_hasher()
+        with mock.patch.object(hasher, 'check', wraps=hasher.check) as check_mock:
+            for _ in range(2):
+                self.assertContains(self.client.post(self.url, data=data), '用户名或密码错误')
+            # 超出限额时不计算哈希
+            response = self.client.post(self.url, data=self.test_user_data)
+            self.assertContains(response, '请求过于频繁，请稍后再试')
+        self.assertEqual(check_mock.call_count, 2)
+
+        # 不存在的用户名同样计入限流
+        data = dict(self.test_user_data, username='1234')
+        for _ in range(2):
+            self.client.post(self.url, data=data)
+        self.assertContains(self.client.post(self.url, data=data), '请求过于频繁，请稍后再试')
+
+        # 其他 IP 不受其他用户名的影响
+        response = self.client.post(self.url, data=dict(self.test_user_data, username='12345'),
+                                    REMOTE_ADDR='10.0.0.1')
+        self.assertContains(response, '用户名或密码错误')
+
+    @override_settings(SHOP_PASSWORD_THROTTLE={'IP_RATE': (1, 60)})
+    def test_ip_throttled(self):
+        self.client.post(reverse('shop:register'), data={
+            'username': '123', 'email': 'a@b.com', 'password': password_encode('12345678'),
+            'password_again': password_encode('1234567'),
+        })
+        response = self.client.post(self.url, data=self.test_user_data)
+        self.assertNotContains(response, '请求过于频繁，请稍后再试')
+        response = self.client.post(reverse('shop:register'), data=dict(self.test_user_data, username='456',
+                                    email='c@d.com', password_again=self.test_user_data['password']))
+        self.assertContains(response, '请求过于频繁，请稍后再试')
+        self.assertFalse(User.objects.exists())
+
+    @override_settings(SHOP_PASSWORD_THROTTLE={'CONCURRENCY': 1, 'LEASE_TIMEOUT': 30})
+    def test_concurrency(self):
+        user = User.objects.create(**self.test_user_data)
+
+        # 其他进程正在计算哈希
+        lease = PasswordCheckLease.objects.create(expires=time.time() + 30)
+        self.assertContains(self.client.post(self.url, data=self.test_user_data), '服务器繁忙，请稍后再试')
+
+        # 租约过期后失效
+        lease.expires = time.time() - 1
+        lease.save()
+        response = self.client.post(self.url, data=self.test_user_data)
+        self.assertEqual(response.status_code, 302)
+        # 计算完成后释放租约
+        self.assertFalse(PasswordCheckLease.objects.exists())
+
+        # 修改密码 API
+        PasswordCheckLease.objects.create(expires=time.time() + 30)
+        response = self.client.post(reverse('shop:api_user_password'), data={
+            '_ext_method': 'update', 'curr_password': self.test_user_data['password'],
+            'new_password': password_encode('a'), 'new_password_again': password_encode('a'),
+        })
+        self.assertEqual(json.loads(response.content)['status'], 503)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password(self.test_user_data['password']))
+
+
 class LogoutViewTest(TestCase):
     """退出登陆视图测试"""
 
@@ -826,7 +2016,7 @@ class LogoutViewTest(TestCase):
         self.assertNotContains(response3, reverse('shop:logout'))
 
 
-class BaseViewTest(TestCase):
+class BaseViewTest(QueryBudgetMixin, TestCase):
     """基本（通用）视图测试"""
 
     test_user_data = {
@@ -853,6 +2043,553 @@ class BaseViewTest(TestCase):
         self.assertEqual(response2.status_code, 200)
         self.assertNotContains(response2, reverse('shop:logout'))
 
+    def test_current_user_resolved_once(self):
+        user = User.objects.create(**self.test_user_data)
+        self.client.post(reverse('shop:login'), data=self.test_user_data)
+
+        # 用户（含用户类型）只查询一次，其余为商品列表查询
+        with self.assertQueryBudget(2):
+            response1 = self.client.get(reverse('shop:goods_list'))
+        self.assertEqual(response1.wsgi_request.current_user, user)
+        self.assertContains(response1, user.username)
+
+        # 授权检查使用缓存的用户类型，不再查询数据库
+        get_usertype_ids()
+        with self.assertQueryBudget(1):
+            response2 = self.client.get(reverse('shop:member_info'))
+        self.assertContains(response2, user.type.typename)
+
+        # 未登录时当前用户为 None
+        self.client.get(reverse('shop:logout'))
+        response3 = self.client.get(reverse('shop:goods_list'))
+        self.assertIsNone(response3.wsgi_request.current_user)
+
+    def test_current_user_lazy(self):
+        User.objects.create(**self.test_user_data)
+        self.client.post(reverse('shop:login'), data=self.test_user_data)
+
+        # 不使用当前用户的请求不查询用户
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.get(reverse('shop:api_goods'))
+            self.client.get('/static/missing.css')
+        self.assertFalse([q for q in queries if '"shop_user"' in q['sql']])
+
+
+class SessionTest(TestCase):
+    """会话测试"""
+
+    def test_anonymous_skips_session(self):
+        goods = Goods.objects.create(goods_name='a', seller=User.objects.create(username='s', email='s@b.com'),
+                                     price=1)
+        with mock.patch.object(sessions.SessionStore, 'load') as load_mock, \
+                mock.patch.object(sessions.SessionStore, 'save') as save_mock:
+            response1 = self.client.get(reverse('shop:goods_list'))
+            response2 = self.client.get(reverse('shop:goods_detail', args=[goods.pk]))
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(response2.status_code, 200)
+        load_mock.assert_not_called()
+        save_mock.assert_not_called()
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response1.cookies)
+        self.assertNotIn('Cookie', response1.get('Vary', ''))
+
+    def test_unchanged_session_not_saved(self):
+        session = sessions.SessionStore()
+        session['user_id'] = 1
+        session.create()
+
+        session = sessions.SessionStore(session.session_key)
+        session['user_id'] = 1
+        self.assertFalse(session.modified)
+        session.update({'user_id': 1})
+        self.assertFalse(session.modified)
+        with self.assertNumQueries(0):
+            session.save()
+
+        session['user_id'] = 2
+        self.assertTrue(session.modified)
+        with CaptureQueriesContext(connections['default']) as queries:
+            session.save()
+        self.assertTrue(queries)
+        self.assertEqual(sessions.SessionStore(session.session_key)['user_id'], 2)
+
+    def test_purge_sessions(self):
+        keys = []
+        for expiry in [-60] * 5 + [60] * 2:
+            session = sessions.SessionStore()
+            session['user_id'] = 1
+            session.set_expiry(expiry)
+            session.create()
+            keys.append(session.session_key)
+
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, stdout=out)
+        self.assertEqual(set(Session.objects.values_list('session_key', flat=True)), set(keys[5:]))
+        self.assertEqual(out.getvalue().count('已删除'), 3)
+
+
+class GoodsAPIViewTest(QueryBudgetMixin, TestCase):
+    """商品目录API视图测试"""
+
+    api_url = reverse('shop:api_goods')
+
+    def setUp(self):
+        self.u1 = User.objects.create(username='abc', password='123', email='a@qq.com')
+        self.u2 = User.objects.create(username='def', password='123', email='b@qq.com')
+        self.goods = [
+            Goods.objects.create(goods_name=f'机械键盘{i}', seller=self.u1 if i % 2 else self.u2, price='9.90',
+                                 image='image.png' if i == 0 else None)
+            for i in range(5)
+        ]
+
+    def pull(self, **params):
+        response = self.client.get(self.api_url, params)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_pull(self):
+        data1 = self.pull()
+        self.assertEqual(data1['status'], 200)
+        self.assertIsNone(data1['next'])
+        self.assertEqual([r['id'] for r in data1['results']], [g.pk for g in self.goods])
+        self.assertEqual(data1['results'][0], {
+            'id': self.goods[0].pk,
+            'goods_name': '机械键盘0',
+            'price': '9.90',
+            'image': self.goods[0].image.url,
+            'seller_id': self.u2.pk,
+            'seller_name': 'def',
+        })
+        self.assertIsNone(data1['results'][1]['image'])
+
+        # 选择字段
+        data2 = self.pull(fields='id,goods_name')
+        self.assertEqual(set(data2['results'][0]), {'id', 'goods_name'})
+
+        # 过滤
+        data3 = self.pull(s=self.u1.pk)
+        self.assertEqual([r['id'] for r in data3['results']], [self.goods[1].pk, self.goods[3].pk])
+        data4 = self.pull(g='键盘', fields='id')
+        self.assertEqual(len(data4['results']), 5)
+
+        # 价格区间和排序
+        Goods.objects.filter(pk=self.goods[2].pk).update(price='19.90')
+        data6 = self.pull(min_price='10', fields='id,price')
+        self.assertEqual(data6['results'], [{'id': self.goods[2].pk, 'price': '19.90'}])
+        data7 = self.pull(sort='-price', fields='id', limit=2)
+        self.assertEqual([r['id'] for r in data7['results']], [self.goods[2].pk, self.goods[4].pk])
+        data8 = self.pull(sort='-price', fields='id', limit=2, c=data7['next'])
+        self.assertEqual([r['id'] for r in data8['results']], [self.goods[3].pk, self.goods[1].pk])
+
+        # pull 方法与 GET 相同
+        response5 = self.client.post(self.api_url, {'_ext_method': 'pull', 'fields': 'id', 's': self.u2.pk})
+        data5 = json.loads(b''.join(response5.streaming_content))
+        self.assertEqual(len(data5['results']), 3)
+
+    def test_paging(self):
+        ids = []
+        params = {'limit': 2, 'fields': 'id'}
+        for _ in range(3):
+            with self.assertQueryBudget(1):
+                data = self.pull(**params)
+            ids.extend(r['id'] for r in data['results'])
+            params['c'] = data['next']
+        self.assertIsNone(params['c'])
+        self.assertEqual(ids, [g.pk for g in self.goods])
+
+    def test_invalid_params(self):
+        for params in [{'fields': 'password'}, {'limit': 0}, {'limit': 'x'}, {'c': 'xxx'}, {'s': 'x'},
+                       {'min_price': 'x'}, {'max_price': 'nan'}, {'sort': 'name'}, {'s': '9' * 23},
+                       {'sort': 'newest', 'min_price': '1'},
+                       {'sort': '-price', 'c': encode_cursor(['abc', 1], ordering=('-price', '-pk'))},
+                       {'sort': 'price', 'c': encode_cursor([None, 1], ordering=('price', 'pk'))},
+                       {'c': encode_cursor(['x'], ordering=('pk',))}]:
+            response = self.client.get(self.api_url, params)
+            # 在开始发送响应之前返回错误
+            self.assertFalse(response.streaming)
+            data = json.loads(response.content)
+            self.assertEqual(data['status'], 412)
+            self.assertEqual(data['errors'], 'Parameters format not correct error.')
+
+
+class APIResultBuilderTest(TestCase):
+    """API结果构造器测试"""
+
+    data = {'price': Decimal('9.90'), 'name': '键盘', 'created': datetime.datetime(2019, 1, 1, 8, 0)}
+
+    def test_serializers(self):
+        expected = {'price': '9.90', 'name': '键盘', 'created': '2019-01-01T08:00:00'}
+        for name in ['json', 'orjson']:
+            if name == 'orjson' and utils.orjson is None:
+                continue
+            with override_settings(SHOP_JSON_SERIALIZER=name):
+                serializer = utils.get_serializer()
+                self.assertEqual(serializer.name, name)
+                self.assertEqual(json.loads(serializer.dumps(self.data)), expected)
+                self.assertEqual(serializer.loads(b'{"a":[1]}'), {'a': [1]})
+
+        with override_settings(SHOP_JSON_SERIALIZER='xml'):
+            self.assertRaises(ValueError, utils.get_serializer)
+
+    @skipIf(utils.orjson is None, 'orjson is not installed')
+    def test_same_output(self):
+        u = User.objects.create(username='abc', password='123', email='a@qq.com')
+        Goods.objects.create(goods_name='键盘', seller=u, price=9.9)
+        data = list(Goods.objects.values('id', 'goods_name', 'price', 'updated_at', 'version'))
+        data.append({'date': datetime.date(2019, 1, 1), 'time': datetime.time(8, 0, 0, 123456), 1: None})
+
+        # 安装 orjson 与否不影响输出
+        self.assertEqual(utils.OrjsonSerializer().dumps(data), utils.JSONSerializer().dumps(data))
+
+    def test_responses(self):
+        response1 = utils.APIResultBuilder().set_results(self.data).as_json_response(412)
+        self.assertEqual(response1['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response1.content)['status'], 412)
+
+        # 流式响应：迭代结束后设置的字段跟在 results 之后
+        builder = utils.APIResultBuilder()
+        builder.stream_chunk_size = 64
+
+        def results():
+            for i in range(100):
+                yield {'id': i}
+            builder.set_next('abc')
+
+        response2 = builder.as_streaming_json_response(results())
+        chunks = list(response2.streaming_content)
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(json.loads(b''.join(chunks)),
+                         {'status': 200, 'results': [{'id': i} for i in range(100)], 'next': 'abc'})
+
+        response3 = utils.APIResultBuilder().as_streaming_json_response([])
+        self.assertEqual(json.loads(b''.join(response3.streaming_content)), {'status': 200, 'results': []})
+
+        # 固定内容的响应只编码一次
+        result = utils.PreencodedResult(errors='Internal server error.', status=500)
+        with mock.patch.object(utils, 'get_serializer') as get_serializer:
+            response4 = result.as_json_response()
+        get_serializer.assert_not_called()
+        self.assertEqual(json.loads(response4.content), {'errors': 'Internal server error.', 'status': 500})
+
+
+class BatchAPIViewTest(TestCase):
+    """批量操作API视图测试"""
+
+    login_url = reverse('shop:login')
+    api_url = reverse('shop:api_batch')
+    test_user_data = {
+        'username': '123',
+        'email': 'a@b.com',
+        'password': password_encode('12345678'),
+    }
+
+    def batch(self, operations, **data):
+        response = self.client.post(self.api_url, dict(data, operations=json.dumps(operations)))
+        return json.loads(response.content)
+
+    def email_operation(self, curr_email, new_email):
+        return {
+            'api': reverse('shop:api_user_email'),
+            '_ext_method': 'update',
+            'params': {'curr_email': curr_email, 'new_email': new_email},
+        }
+
+    def test_batch(self):
+        user = User.objects.create(**self.test_user_data)
+        Goods.objects.create(goods_name='pc', seller=user, price=9.9)
+        pull_operation = {'api': reverse('shop:api_goods'), '_ext_method': 'pull', 'params': {'fields': 'goods_name'}}
+
+        # 未登录时只有允许访客访问的操作成功
+        data1 = self.batch([pull_operation, self.email_operation('a@b.com', 'c@d.com')])
+        self.assertEqual(data1['status'], 200)
+        self.assertEqual(data1['results'][0]['results'], [{'goods_name': 'pc'}])
+        self.assertEqual(data1['results'][1]['status'], 403)
+
+        # 登陆后，当前用户只查询一次
+        self.client.post(self.login_url, self.test_user_data)
+        operations = [self.email_operation('a@b.com', 'c@d.com'), self.email_operation('c@d.com', 'e@f.com')]
+        with CaptureQueriesContext(connections['default']) as queries:
+            data2 = self.batch(operations)
+        self.assertEqual([r['status'] for r in data2['results']], [200, 200])
+        user_queries = [q for q in queries if q['sql'].startswith('SELECT') and '"shop_user"' in q['sql']]
+        self.assertEqual(len(user_queries), 1)
+        user.refresh_from_db()
+        self.assertEqual(user.email, 'e@f.com')
+
+        # 错误的参数或操作
+        self.assertEqual(self.batch({'api': 'x'})['status'], 412)
+        data3 = self.batch([{'api': '/shop/', '_ext_method': 'pull'},
+                            {'api': reverse('shop:api_goods'), '_ext_method': 'delete'},
+                            {'api': self.api_url, '_ext_method': 'pull'}])
+        self.assertEqual([r['status'] for r in data3['results']], [405, 405, 405])
+
+    def test_atomic(self):
+        user = User.objects.create(**self.test_user_data)
+        self.client.post(self.login_url, self.test_user_data)
+        operations = [
+            self.email_operation('a@b.com', 'c@d.com'),
+            self.email_operation('a@b.com', 'e@f.com'),
+            self.email_operation('c@d.com', 'g@h.com'),
+        ]
+
+        # 第二个操作失败，第一个操作被回滚，第三个操作不再执行
+        data1 = self.batch(operations, atomic='1')
+        self.assertEqual(data1['status'], 412)
+        self.assertEqual([r['status'] for r in data1['results']], [200, 412])
+        user.refresh_from_db()
+        self.assertEqual(user.email, 'a@b.com')
+
+        # 非事务模式下各操作独立执行
+        data2 = self.batch(operations)
+        self.assertEqual([r['status'] for r in data2['results']], [200, 412, 200])
+        user.refresh_from_db()
+        self.assertEqual(user.email, 'g@h.com')
+
+    def test_password_operation(self):
+        user = User.objects.create(**self.test_user_data)
+        self.client.post(self.login_url, self.test_user_data)
+        new_password = password_encode('a')
+        operations = [{
+            'api': reverse('shop:api_user_password'),
+            '_ext_method': 'update',
+            'params': {'curr_password': self.test_user_data['password'],
+                       'new_password': new_password, 'new_password_again': new_password},
+        }]
+
+        # 校验密码的操作不能在事务中执行
+        self.assertEqual(self.batch(operations, atomic='1')['status'], 412)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password(self.test_user_data['password']))
+
+        data = self.batch(operations)
+        self.assertEqual([r['status'] for r in data['results']], [200])
+        user.refresh_from_db()
+        self.assertTrue(user.check_password(new_password))
+
+
+class SeedShopCommandTest(TestCase):
+    """批量生成测试数据命令测试"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_seed(self):
+        hasher = hashing.get_hasher()
+        with mock.patch.object(hasher, 'hash', wraps=hasher.hash) as hash_mock:
+            call_command('seed_shop', users=30, goods=60, images=2, image_ratio=0.5, batch_size=7,
+                         seller_ratio=0.5, seed=1, stdout=StringIO())
+
+        # 所有用户共用一个密码哈希
+        self.assertEqual(hash_mock.call_count, 1)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(User.objects.values('password').distinct().count(), 1)
+        self.assertTrue(User.objects.first().check_password(password_encode('12345678')))
+
+        self.assertEqual(Goods.objects.count(), 60)
+        sellers = set(User.objects.filter(type_id=get_usertype_id('seller')).values_list('pk', flat=True))
+        self.assertTrue(set(Goods.objects.values_list('seller_id', flat=True)) <= sellers)
+        self.assertTrue(all(Decimal('29') <= p <= Decimal('19999.99')
+                            for p in Goods.objects.values_list('price', flat=True)))
+        image_names = set(Goods.objects.exclude(image='').values_list('image', flat=True))
+        self.assertEqual(len(image_names), 2)
+        for name in image_names:
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+
+        # 检索索引已重建
+        goods = Goods.objects.first()
+        found = search.search_goods(Goods.objects.all(), goods.goods_name.split()[1])
+        self.assertIn(goods, found)
+
+        # 重复执行时用户名不冲突
+        call_command('seed_shop', users=5, goods=0, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 35)
+
+
+@mock.patch.object(User, 'SALT_ROUNDS', 4)
+class ImportUsersCommandTest(TestCase):
+    """批量导入用户命令测试"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'users.csv')
+        User.objects.create(username='exists', password='12345678', email='exists@b.com')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write_csv(self, rows):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('username,email,password,type\n')
+            for row in rows:
+                f.write(','.join(row) + '\n')
+
+    def test_import(self):
+        self.write_csv([
+            ('user1', 'u1@b.com', '12345678', ''),
+            ('user2', 'u2@b.com', '12345678', 'seller'),
+            ('user3', 'not-an-email', '12345678', ''),
+            ('user1', 'u4@b.com', '12345678', ''),
+            ('exists', 'u5@b.com', '12345678', ''),
+            ('user6', 'u6@b.com', '12345678', 'admin'),
+            ('user7', 'u7@b.com', '12345678', ''),
+        ])
+        rejects = os.path.join(self.directory, 'rejects.jsonl')
+        out = StringIO()
+        call_command('import_users', self.path, chunk_size=3, workers=2, rejects=rejects, stdout=out)
+
+        self.assertIn('导入 3 个用户，拒绝 4 个', out.getvalue())
+        self.assertEqual(sorted(User.objects.filter(username__startswith='user').values_list('username', flat=True)),
+                         ['user1', 'user2', 'user7'])
+        self.assertTrue(User.objects.get(username='user1').check_password(password_encode('12345678')))
+        self.assertEqual(User.objects.get(username='user2').type_id, get_usertype_id('seller'))
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+        with open(rejects, encoding='utf-8') as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEqual(sorted(r['line'] for r in rejected), [4, 5, 6, 7])
+
+    def test_resume(self):
+        self.write_csv([(f'user{i}', f'u{i}@b.com', '12345678', '') for i in range(6)])
+
+        # 第二块插入时失败，检查点停留在第一块之后
+        original_insert = importing.UserImporter.insert
+        calls = []
+
+        def failing_insert(importer, users):
+            calls.append(len(users))
+            if len(calls) == 2:
+                raise RuntimeError('crash')
+            original_insert(importer, users)
+
+        with mock.patch.object(importing.UserImporter, 'insert', failing_insert):
+            with self.assertRaises(RuntimeError):
+                importing.UserImporter(self.path, chunk_size=2, workers=1).run()
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 2)
+        with open(self.path + '.checkpoint', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['processed'], 2)
+
+        stats = importing.UserImporter(self.path, chunk_size=2, workers=1).run(resume=True)
+        self.assertEqual(stats, {'processed': 6, 'imported': 6, 'rejected': 0})
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 6)
+
+
+class BenchmarkTest(TestCase):
+    """基准测试工具测试"""
+
+    def test_scenarios(self):
+        users, goods_ids = benchmark.seed(users=5, goods=20)
+        self.assertEqual(len(users), 5)
+        self.assertEqual(len(goods_ids), 20)
+        self.assertEqual(search.search_goods(Goods.objects.all(), benchmark.SEED_KEYWORD).exists(), True)
+
+        # 每个路由都有对应的场景，且都能正常执行
+        scenarios = benchmark.build_scenarios(users, goods_ids)
+        self.assertEqual(benchmark.missing_routes(scenarios), [])
+        for scenario in scenarios:
+            result = benchmark.run_scenario(scenario, users, requests=2, clients=1, warmup=0)
+            self.assertEqual(result['requests'], 2, scenario.label)
+            self.assertEqual(result['errors'], 0, scenario.label)
+
+    def test_compare(self):
+        self.assertEqual(benchmark.percentile([3, 1, 2, 4], 50), 2)
+        self.assertEqual(benchmark.percentile([3, 1, 2, 4], 99), 4)
+
+        base = {'throughput': 100.0, 'p95_ms': 10.0, 'queries': 2.0}
+        baseline = {'a': base, 'b': base, 'c': base}
+        results = {
+            'a': {'throughput': 95.0, 'p95_ms': 11.0, 'queries': 2.0},
+            'b': {'throughput': 50.0, 'p95_ms': 20.0, 'queries': 3.0},
+            'd': base,
+        }
+        regressions = benchmark.compare(results, baseline, threshold=20)
+        self.assertEqual(list(regressions), ['b'])
+        self.assertEqual(len(regressions['b']), 3)
+
+
+class IndexUsageTest(TestCase):
+    """各视图的查询都能使用索引（基于 SQLite 的 EXPLAIN QUERY PLAN）"""
+
+    def explain(self, sql):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertQueriesUseIndexes(self, queries, label):
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+
+            plan = self.explain(sql)
+            uses_fts = search.INDEX_TABLE in sql
+            for detail in plan:
+                # 按检索相关度排序时需要临时排序，其余查询的排序必须由索引完成
+                if 'TEMP B-TREE' in detail and not uses_fts:
+                    self.fail(f'{label}: sorting without index: {sql}\n{plan}')
+                # 只有不带过滤条件、按主键顺序读取前若干行时允许扫描表
+                if detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail and 'USING' not in detail \
+                        and not self.is_unfiltered_pk_scan(sql):
+                    self.fail(f'{label}: full table scan: {sql}\n{plan}')
+
+    @staticmethod
+    def is_unfiltered_pk_scan(sql):
+        return ' WHERE ' not in sql and ' LIMIT ' in sql \
+            and re.search(r' ORDER BY "\w+"\."id" (ASC|DESC)( LIMIT |$)', sql) is not None
+
+    def test_views(self):
+        users, goods_ids = benchmark.seed(users=10, goods=50)
+
+        for scenario in benchmark.build_scenarios(users, goods_ids):
+            client = benchmark.login_client(users[1]) if scenario.login else Client()
+            if scenario.prepare:
+                client = scenario.prepare(client, users[1])
+            with CaptureQueriesContext(connections['default']) as queries:
+                scenario.request(client)
+            self.assertQueriesUseIndexes(queries, scenario.label)
+
+        # 翻页、注册
+        client = Client()
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = client.get(reverse('shop:goods_list'))
+            client.get(reverse('shop:goods_list'), {'c': response.context['page_obj'].next_cursor})
+            client.get(reverse('shop:api_goods'), {'c': encode_cursor([goods_ids[10]], ordering=('pk',)),
+                                                   's': users[0].pk})
+            # 价格区间与排序、商家的各种组合
+            for params in [{'min_price': 100}, {'max_price': 500, 's': users[0].pk}, {'sort': 'price'},
+                           {'sort': '-price', 'min_price': 100, 'max_price': 5000}, {'sort': 'price', 's': users[0].pk},
+                           {'sort': 'newest', 's': users[0].pk}]:
+                response = client.get(reverse('shop:goods_list'), params)
+                self.assertEqual(response.status_code, 200)
+                if response.context['page_obj'].has_next():
+                    client.get(reverse('shop:goods_list'), dict(params, c=response.context['page_obj'].next_cursor))
+            # 最新上架与价格区间无法由同一个索引支持，不允许组合使用
+            for params in [{'sort': 'newest', 'min_price': 100},
+                           {'sort': 'newest', 's': users[0].pk, 'min_price': 100, 'max_price': 5000}]:
+                self.assertEqual(client.get(reverse('shop:goods_list'), params).status_code, 404)
+                self.assertEqual(json.loads(client.get(reverse('shop:api_goods'), params).content)['status'], 412)
+            client.post(reverse('shop:register'), {
+                'username': 'newuser', 'email': 'NEW@b.com',
+                'password': password_encode('12345678'), 'password_again': password_encode('12345678'),
+            })
+        self.assertQueriesUseIndexes(queries, 'extra')
+
+        # 按邮箱查询用户（批量导入）
+        with CaptureQueriesContext(connections['default']) as queries:
+            list(User.objects.filter_email('NEW@b.com', 'a@b.com'))
+        plan = self.explain(queries[0]['sql'])
+        self.assertIn('shop_user_email_lower_uniq', ' '.join(plan))
+
+    def test_email_unique(self):
+        User.objects.create(username='abc', password='123', email='a@b.com')
+        with self.assertRaises(IntegrityError):
+            User.objects.create(username='def', password='123', email='A@B.com')
+
 
 class UserEmailAPIViewTest(TestCase):
     """用户邮箱API视图测试"""
@@ -865,6 +2602,27 @@ class UserEmailAPIViewTest(TestCase):
         'password': password_encode('12345678'),
     }
 
+    def test_csrf(self):
+        User.objects.create(**self.test_user_data)
+        client = Client(enforce_csrf_checks=True)
+        client.get(self.login_url)
+        csrf_token = client.cookies['csrftoken'].value
+        client.post(self.login_url, dict(self.test_user_data, csrfmiddlewaretoken=csrf_token))
+        update_data = {'curr_email': 'a@b.com', 'new_email': 'c@d.com', '_ext_method': 'update'}
+
+        # 无CSRFToken的提交被拒绝，批量操作同样如此
+        response1 = client.post(self.api_url, update_data)
+        self.assertEqual(response1.status_code, 403)
+        operations = [{'api': self.api_url, '_ext_method': 'update', 'params': update_data}]
+        response2 = client.post(reverse('shop:api_batch'), {'operations': json.dumps(operations)})
+        self.assertEqual(response2.status_code, 403)
+        self.assertEqual(User.objects.get().email, 'a@b.com')
+
+        # 带CSRFToken的提交成功
+        response3 = client.post(self.api_url, dict(update_data, csrfmiddlewaretoken=csrf_token))
+        self.assertEqual(json.loads(response3.content)['status'], 200)
+        self.assertEqual(User.objects.get().email, 'c@d.com')
+
     def test_update_email(self):
         user = User.objects.create(**self.test_user_data)
         update_data = {
@@ -915,6 +2673,17 @@ class UserEmailAPIViewTest(TestCase):
         self.assertEqual(data5['status'], 412)
         self.assertEqual(data5['errors'], 'The current user-email is incorrect.')
 
+        # 新邮箱已被其他用户使用（不区分大小写），失败
+        User.objects.create(username='456', password='12345678', email='other@b.com')
+        update_data_temp3 = update_data.copy()
+        update_data_temp3['new_email'] = 'OTHER@b.com'
+        response7 = self.client.post(self.api_url, update_data_temp3)
+        data7 = json.loads(response7.content)
+        self.assertEqual(data7['status'], 412)
+        self.assertEqual(data7['errors'], 'The new user-email is already in use.')
+        user.refresh_from_db()
+        self.assertEqual(user.email, self.test_user_data['email'])
+
         # 用户已被删除，失败
         user.delete()
         response6 = self.client.post(self.api_url, update_data)
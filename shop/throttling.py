@@ -0,0 +1,144 @@
+"""密码相关请求的准入控制
+
+登陆、注册和修改密码的请求各需计算一次 bcrypt（约 250ms CPU），撞库攻击时这些请求会占满所有工作进程。
+在计算哈希之前依次检查：
+    1. 按客户端 IP 和按用户名的令牌桶限流，超出时抛出 Throttled ；
+    2. 所有工作进程中同时计算的哈希数量，超出时抛出 hashing.PasswordHasherBusy 。
+令牌桶和租约保存在数据库中（ThrottleBucket 和 PasswordCheckLease），多个工作进程共享。
+password_check 不能在事务中使用：未提交的令牌和租约对其他进程不可见，SQLite 上还会在计算哈希期间一直持有写锁。
+
+客户端 IP 取自 REMOTE_ADDR ，部署在反向代理之后时需由代理设置正确的 REMOTE_ADDR 。
+"""
+
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.db.utils import IntegrityError, OperationalError
+
+from .hashing import PasswordHasherBusy
+from .models import ThrottleBucket, PasswordCheckLease
+
+
+# 默认配置，可在 settings.SHOP_PASSWORD_THROTTLE 中覆盖
+DEFAULTS = {
+    # 每个 IP 的限额：(令牌桶容量, 补满所需的秒数)，为 None 时不限制
+    'IP_RATE': (30, 60),
+    # 每个用户名的限额，格式同上
+    'USERNAME_RATE': (10, 60),
+    # 所有工作进程中同时计算的最大数量，为 None 时不限制
+    'CONCURRENCY': 8,
+    # 租约的有效时间（秒），进程异常退出未释放的租约过期后自动失效
+    'LEASE_TIMEOUT': 30,
+}
+
+
+class Throttled(Exception):
+    """请求过于频繁"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def get_options():
+    return dict(DEFAULTS, **getattr(settings, 'SHOP_PASSWORD_THROTTLE', {}))
+
+
+def take_token(key, capacity, period, now=None):
+    """从令牌桶中取出一个令牌，返回是否成功
+
+    令牌数量的计算和扣减在一条 UPDATE 语句中完成，多个进程同时请求时不会超发。
+    """
+
+    now = time.time() if now is None else now
+    rate = capacity / period
+    available = Least(Value(float(capacity)), F('tokens') + (Value(now) - F('updated')) * Value(rate))
+
+    buckets = ThrottleBucket.objects \
+        .filter(key=key) \
+        .annotate(available=available) \
+        .filter(available__gte=1)
+    if buckets.update(tokens=available - 1, updated=now):
+        return True
+
+    # 令牌桶不存在时创建；已存在（令牌不足，或其他进程刚刚创建）时再扣减一次
+    try:
+        with transaction.atomic():
+            ThrottleBucket.objects.create(key=key, tokens=capacity - 1, updated=now)
+        return True
+    except IntegrityError:
+        return bool(buckets.update(tokens=available - 1, updated=now))
+
+
+def clear_idle_buckets(now=None):
+    """删除已经补满的令牌桶（与不存在等价），返回删除的数量"""
+
+    now = time.time() if now is None else now
+    options = get_options()
+    periods = [rate[1] for rate in (options['IP_RATE'], options['USERNAME_RATE']) if rate]
+    return ThrottleBucket.objects.filter(updated__lt=now - max(periods, default=0)).delete()[0]
+
+
+def acquire_lease(limit, timeout, now=None):
+    """申请一个哈希计算的租约，返回租约ID；已达到上限时返回 None
+
+    租约先单独提交再计数，不需要加锁：同时申请的进程中，后计数的一方能看到所有已提交的租约，
+    超出上限时删除自己的租约，因此有效的租约不会超过上限。
+    """
+
+    now = time.time() if now is None else now
+    try:
+        with transaction.atomic(durable=True):
+            PasswordCheckLease.objects.filter(expires__lt=now).delete()
+            lease_id = PasswordCheckLease.objects.create(expires=now + timeout).pk
+        if PasswordCheckLease.objects.filter(expires__gte=now).count() > limit:
+            release_lease(lease_id)
+            return None
+        return lease_id
+    except OperationalError:
+        # 其他进程正在申请（数据库被锁定），视为繁忙
+        return None
+
+
+def release_lease(lease_id):
+    PasswordCheckLease.objects.filter(pk=lease_id).delete()
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+@contextmanager
+def password_check(request, username):
+    """在计算密码哈希之前检查限流和并发数量
+
+    Examples
+    --------
+    with password_check(request, username):
+        user.check_password(password)
+    """
+
+    options = get_options()
+    now = time.time()
+
+    for prefix, value, rate in (('ip', client_ip(request), options['IP_RATE']),
+                                ('username', username, options['USERNAME_RATE'])):
+        if rate and not take_token(f'{prefix}:{value}', *rate, now=now):
+            capacity, period = rate
+            raise Throttled('Too many password attempts.', retry_after=period / capacity)
+
+    lease_id = None
+    if options['CONCURRENCY']:
+        lease_id = acquire_lease(options['CONCURRENCY'], options['LEASE_TIMEOUT'], now=now)
+        if lease_id is None:
+            raise PasswordHasherBusy('Too many concurrent password checks.')
+
+    try:
+        yield
+    finally:
+        if lease_id is not None:
+            release_lease(lease_id)
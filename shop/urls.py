@@ -25,6 +25,8 @@ urlpatterns = [
     # API
     path('api/errors/unauthorized', views.UnauthorizedErrorApiView.as_view(), name='api_unauthorized_error'),
     path('api/errors/internal_server', views.ServerErrorApiView.as_view(), name='api_server_error'),
+    path('api/batch', views.BatchAPIView.as_view(), name='api_batch'),
+    path('api/goods', views.GoodsAPIView.as_view(), name='api_goods'),
     path('api/user/email', views.UserEmailAPIView.as_view(), name='api_user_email'),
     path('api/user/password', views.UserPasswordAPIView.as_view(), name='api_user_password'),
 ]
@@ -1,10 +1,97 @@
 import json
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONSerializer:
+    """使用标准库 json 的序列化器"""
+
+    name = 'json'
+
+    def __init__(self):
+        # 与 orjson 一样直接输出 UTF-8 ，两种序列化器的结果相同
+        self.encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(self, data):
+        """将数据编码为 bytes"""
+
+        return self.encoder.encode(data).encode('utf-8')
+
+    def loads(self, content):
+        return json.loads(content)
+
+
+class OrjsonSerializer(JSONSerializer):
+    """使用 orjson 的序列化器，编码速度约为标准库的数倍"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        super().__init__()
+        # 日期时间同样交给 DjangoJSONEncoder ，微秒和时区的格式与标准库序列化器一致
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, data):
+        # orjson 不支持的类型（如 Decimal）交给 DjangoJSONEncoder 处理
+        return orjson.dumps(data, default=self.encoder.default, option=self.options)
+
+    def loads(self, content):
+        return orjson.loads(content)
+
+
+SERIALIZERS = {
+    'json': JSONSerializer,
+    'orjson': OrjsonSerializer,
+}
+
+_serializers = {}
+
+
+def get_serializer():
+    """获取 JSON 序列化器
+
+    由 settings.SHOP_JSON_SERIALIZER 指定（'json' 或 'orjson'），默认在安装了 orjson 时使用 orjson 。
+    """
+
+    name = getattr(settings, 'SHOP_JSON_SERIALIZER', None) or ('orjson' if orjson is not None else 'json')
+    if name not in _serializers:
+        if name not in SERIALIZERS:
+            raise ValueError(f'unknown JSON serializer "{name}"')
+        _serializers[name] = SERIALIZERS[name]()
+    return _serializers[name]
+
+
+class PreencodedResult:
+    """内容固定的API结果
+
+    在创建时编码一次，之后每次响应直接发送编码好的内容。
+    """
+
+    def __init__(self, results=None, errors=None, status=200):
+        builder = APIResultBuilder()
+        if results is not None:
+            builder.set_results(results)
+        if errors is not None:
+            builder.set_errors(errors)
+        builder.data['status'] = status
+        self.content = get_serializer().dumps(builder.data)
+
+    def as_json_response(self):
+        return HttpResponse(self.content, content_type='application/json')
 
 
 class APIResultBuilder:
 
+    # 流式响应中每次发送的最小字节数
+    stream_chunk_size = 16 * 1024
+
     def __init__(self):
         self.data = {}
 
@@ -16,9 +103,43 @@ class APIResultBuilder:
         self.data['errors'] = error
         return self
 
+    def set_next(self, cursor):
+        self.data['next'] = cursor
+        return self
+
     def as_json(self):
-        return json.dumps(self.data)
+        return get_serializer().dumps(self.data).decode('utf-8')
 
     def as_json_response(self, status=200):
         self.data['status'] = status
-        return JsonResponse(self.data)
+        return HttpResponse(get_serializer().dumps(self.data), content_type='application/json')
+
+    def as_streaming_json_response(self, results, status=200):
+        """以流的形式返回 JSON
+
+        results 是一个可迭代对象，其中的元素逐个编码，攒够 stream_chunk_size 字节后发送，
+        不会在内存中构造完整的响应。迭代结束后才设置的字段（如 set_next() 设置的游标）会跟在 results 之后发送。
+        """
+
+        self.data['status'] = status
+        self.data.pop('results', None)
+
+        def stream():
+            serializer = get_serializer()
+            head = dict(self.data)
+            chunk = [serializer.dumps(head)[:-1] + (b',' if head else b'') + b'"results":[']
+            size = 0
+
+            for i, result in enumerate(results):
+                encoded = serializer.dumps(result)
+                chunk.append(b',' + encoded if i else encoded)
+                size += len(encoded)
+                if size >= self.stream_chunk_size:
+                    yield b''.join(chunk)
+                    chunk, size = [], 0
+
+            tail = {key: value for key, value in self.data.items() if key not in head}
+            chunk.append(b']' + (b',' + serializer.dumps(tail)[1:] if tail else b'}'))
+            yield b''.join(chunk)
+
+        return StreamingHttpResponse(stream(), content_type='application/json')
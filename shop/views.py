@@ -1,30 +1,43 @@
-from django.http import HttpRequest
+import contextlib
+import copy
+import hashlib
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.http import HttpRequest, Http404, QueryDict
 from django.views import generic
 from django.shortcuts import render, reverse, get_object_or_404, HttpResponseRedirect
+from django.db import transaction
 from django.db.utils import IntegrityError
+from django.urls import resolve
 
-from .models import User, UserType, Goods
+from .models import User, Goods, SellerSummary, get_usertype_id, get_usertype_ids, unique_error_field
 from .forms import (RegisterFEForm, RegisterBEForm, LoginFEForm, LoginBEForm, ChangeEmailForm, ChangePasswordFEForm,
                     ChangePasswordBEForm)
-from .utils import APIResultBuilder
+from .utils import APIResultBuilder, PreencodedResult, get_serializer
+from .middleware import load_current_user, resolve_current_user
+from .hashing import PasswordHasherBusy
+from .throttling import Throttled, password_check
+from .pagination import CursorPaginator, InvalidCursor, encode_cursor
+from . import search
+from . import caching
 
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.utils.decorators import method_decorator
 
 
-def get_current_user(request):
-    """获取当前用户对象"""
+logger = logging.getLogger(__name__)
 
-    try:
-        user_id = request.session['user_id']
-        user = User.objects.get(id=user_id)
 
-        return user
-    except (User.DoesNotExist, KeyError) as e:
-        # 删除无效的用户登陆关联
-        if type(e) is User.DoesNotExist:
-            associate_user_to_client(request, None)
+def get_current_user(request):
+    """获取当前用户对象
 
-        return None
+    当前用户由 CurrentUserMiddleware 在首次读取时解析，每个请求只解析一次。
+    """
+
+    if not hasattr(request, 'current_user'):
+        request.current_user = load_current_user(request)
+    return resolve_current_user(request)
 
 
 def associate_user_to_client(request, user_id):
@@ -32,8 +45,12 @@ def associate_user_to_client(request, user_id):
 
     if user_id is None:
         request.session.flush()
+        request.current_user = None
     else:
         request.session['user_id'] = user_id
+        # 当前用户已改变，下次读取时重新解析
+        if hasattr(request, 'current_user'):
+            del request.current_user
 
 
 def redirect_to_index():
@@ -42,6 +59,26 @@ def redirect_to_index():
     return HttpResponseRedirect(reverse('shop:goods_list'))
 
 
+def is_authorized(request, usertype):
+    """检查当前用户的类型是否属于 usertype （格式同 user_auth 的 usertype 参数）"""
+
+    # 访客和所有用户类型都允许访问时不需要解析当前用户
+    if isinstance(usertype, (list, tuple)) and None in usertype and get_usertype_ids().keys() <= set(usertype):
+        return True
+
+    current_user = get_current_user(request)
+    current_usertype_id = current_user.type_id if current_user else None
+
+    # 用户类型ID来自进程内缓存，不查询数据库
+    if usertype is None:
+        return current_usertype_id is None
+    elif isinstance(usertype, str):
+        return current_usertype_id == get_usertype_id(usertype)
+    else:
+        auth_usertype_ids = [get_usertype_id(t) if t else None for t in usertype]
+        return current_usertype_id in auth_usertype_ids
+
+
 def user_auth(usertype, error_viewname=None):
     """用户授权管理修饰器
 
@@ -90,21 +127,7 @@ def user_auth(usertype, error_viewname=None):
                 raise TypeError(f'{type(first_arg)} is not django.views.View or django.http.HttpRequest object, '
                                 'The first-parameter must be django.views.View or django.http.HttpRequest')
 
-            # 获取当前用户的类型
-            current_user = get_current_user(request)
-            current_usertype = current_user.type if current_user else None
-
-            # 用户类型认证
-            authorized = False
-            if usertype is None:
-                authorized = current_usertype is None
-            elif isinstance(usertype, str):
-                authorized = current_usertype == UserType.objects.get(typename=usertype)
-            elif isinstance(usertype, (list, tuple)):
-                auth_usertype = [UserType.objects.get(typename=t) if t else None for t in usertype]
-                authorized = current_usertype in auth_usertype
-
-            if authorized:
+            if is_authorized(request, usertype):
                 return func(*args, **kwargs)
             elif error_viewname is None:
                 return HttpResponseRedirect(reverse('shop:error_403'))
@@ -134,46 +157,224 @@ class BasicUserView(generic.base.ContextMixin):
         return super().get_context_data(**kwargs)
 
 
+# 商品列表的排序方式（sort 参数）及其排序字段，均由索引支持：
+# 按价格排序使用 (price, id) 索引，按商家过滤时使用 (seller, price) 索引；降序时ID同样降序，可反向扫描索引
+GOODS_SORTS = {
+    'price': ('price', 'pk'),
+    '-price': ('-price', '-pk'),
+    'newest': ('-pk',),
+}
+# 不能与价格区间同时使用的排序方式：价格的范围条件和按ID排序无法由同一个索引支持，
+# 只能扫描整个表（或商家的所有商品）过滤价格，或取出价格区间内的所有商品再排序
+GOODS_SORTS_WITHOUT_PRICE_RANGE = {'newest'}
+
+# 数据库整数字段的取值范围（64 位有符号整数）
+_MIN_ID, _MAX_ID = -2 ** 63, 2 ** 63 - 1
+
+
+def parse_id(value):
+    """将查询参数转换为对象ID，格式错误或超出整数字段的范围时抛出 ValueError"""
+
+    pk = int(value)
+    if not _MIN_ID <= pk <= _MAX_ID:
+        raise ValueError(value)
+    return pk
+
+
+def filter_goods(queryset, params):
+    """按 g 、s 、min_price 、max_price 参数检索和过滤商品，参数格式错误时抛出 ValueError"""
+
+    # 按商品关键词检索
+    if 'g' in params:
+        queryset = search.search_goods(queryset, params['g'])
+
+    # 按商家ID过滤
+    if 's' in params:
+        queryset = queryset.filter(seller_id=parse_id(params['s']))
+
+    # 按价格区间过滤
+    for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+        if params.get(param):
+            try:
+                price = Decimal(params[param])
+            except InvalidOperation:
+                raise ValueError(params[param])
+            if not price.is_finite():
+                raise ValueError(params[param])
+            queryset = queryset.filter(**{lookup: price})
+
+    return queryset
+
+
+def get_goods_ordering(params):
+    """商品列表的排序字段，sort 参数错误时抛出 ValueError
+
+    未指定 sort 时，检索结果按相关度排序；按价格区间过滤时按价格排序，只需扫描索引中的一段；其余按ID排序。
+    按最新上架排序不能与价格区间同时使用（见 GOODS_SORTS_WITHOUT_PRICE_RANGE ）。
+    """
+
+    sort = params.get('sort')
+    if sort:
+        if sort not in GOODS_SORTS:
+            raise ValueError(sort)
+        if sort in GOODS_SORTS_WITHOUT_PRICE_RANGE and (params.get('min_price') or params.get('max_price')):
+            raise ValueError(sort)
+        return GOODS_SORTS[sort]
+
+    if 'g' in params:
+        return 'search_rank', 'pk'
+    if params.get('min_price') or params.get('max_price'):
+        return GOODS_SORTS['price']
+    return ('pk',)
+
+
 class GoodsListView(generic.ListView, BasicUserView):
     """商品列表视图"""
 
     template_name = 'shop/goods_list.html'
+    paginate_by = 20
+    page_kwarg = 'c'
+    # 影响列表内容的查询参数，用于生成列表缓存的键
+    cache_params = ('g', 's', 'min_price', 'max_price', 'sort', 'c')
 
     def get_queryset(self):
-        queryset = Goods.objects.all()
+        # 只取出模板中用到的字段，商家名称通过 JOIN 一并取出
+        queryset = Goods.objects \
+            .select_related('seller') \
+            .only('goods_name', 'price', 'image', 'version', 'seller__username') \
+            .prefetch_related('image_variants')
 
-        # 按商品关键词过滤
-        if 'g' in self.request.GET:
-            goods_kws = self.request.GET['g']
-            queryset = queryset.filter(goods_name__contains=goods_kws)
+        try:
+            return filter_goods(queryset, self.request.GET)
+        except ValueError:
+            raise Http404('无效的过滤参数')
 
-        # 按商家ID过滤
-        if 's' in self.request.GET:
-            seller_id = self.request.GET['s']
-            queryset = queryset.filter(seller_id=seller_id)
+    def get_ordering(self):
+        try:
+            return get_goods_ordering(self.request.GET)
+        except ValueError:
+            raise Http404('无效的排序方式')
+
+    def paginate_queryset(self, queryset, page_size):
+        """使用游标分页代替 Django 默认的 OFFSET 分页"""
+
+        paginator = CursorPaginator(queryset, self.get_ordering(), page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.page_kwarg))
+        except InvalidCursor:
+            raise Http404('无效的分页游标')
+
+        # 页面内容在模板中首次访问时才查询，列表缓存命中时不会查询数据库
+        return paginator, page, page, True
 
-        return queryset
+    def get_page_cache_key(self):
+        """商品列表缓存键中的过滤参数部分"""
+
+        query = QueryDict(mutable=True)
+        for param in self.cache_params:
+            if param in self.request.GET:
+                query[param] = self.request.GET[param]
+        return query.urlencode()
+
+    def get_page_query(self):
+        """翻页链接中需要保留的查询参数（不含游标），以“&”结尾"""
+
+        # 只保留缓存键中的参数，其他参数不能写入按缓存键共享的页面片段
+        query = QueryDict(mutable=True)
+        for param in self.cache_params:
+            if param != self.page_kwarg and param in self.request.GET:
+                query[param] = self.request.GET[param]
+        return query.urlencode() + '&' if query else ''
 
     def get_context_data(self, *, object_list=None, **kwargs):
         # 添加用户对象到 context
         object_list = super().get_context_data(request=self.request, kwargs=kwargs)
 
+        # 添加翻页参数到context
+        object_list['page_query'] = self.get_page_query()
+
+        # 添加列表缓存的参数到context
+        object_list['catalog_generation'] = caching.get_catalog_generation()
+        object_list['page_cache_key'] = self.get_page_cache_key()
+        object_list['fragment_cache_timeout'] = caching.get_fragment_timeout()
+
         # 添加搜索词到context
         if 'g' in self.request.GET:
             object_list['search_text'] = self.request.GET['g']
 
-        # 添加商家到context
+        # 添加价格区间和排序方式到context
+        object_list['min_price'] = self.request.GET.get('min_price', '')
+        object_list['max_price'] = self.request.GET.get('max_price', '')
+        object_list['sort'] = self.request.GET.get('sort', '')
+
+        # 添加商家及其汇总数据到context，只需查询一行汇总数据（JOIN 商家）
         if 's' in self.request.GET:
-            object_list['seller'] = get_object_or_404(User, id=self.request.GET['s'])
+            try:
+                seller_id = parse_id(self.request.GET['s'])
+            except ValueError:
+                raise Http404('无效的过滤参数')
+            try:
+                summary = SellerSummary.objects \
+                    .select_related('seller') \
+                    .only('goods_count', 'min_price', 'max_price', 'seller__username') \
+                    .get(seller_id=seller_id)
+            except SellerSummary.DoesNotExist:
+                # 没有商品的商家
+                summary = SellerSummary(seller=get_object_or_404(User.objects.only('username'), id=seller_id))
+            object_list['seller'] = summary.seller
+            object_list['seller_summary'] = summary
 
         return object_list
 
 
+def _goods_validators(request, pk):
+    """获取商品的 (version, updated_at) ，同一请求内只查询一次，商品不存在时返回 None"""
+
+    if not hasattr(request, '_goods_validators'):
+        request._goods_validators = Goods.objects.filter(pk=pk).values_list('version', 'updated_at').first()
+    return request._goods_validators
+
+
+def goods_detail_etag(request, pk, *args, **kwargs):
+    """商品详情页的 ETag ：由商品版本和当前用户组成（页面头部显示了当前用户名）"""
+
+    validators = _goods_validators(request, pk)
+    if validators is None:
+        return None
+
+    current_user = get_current_user(request)
+    if current_user is None:
+        return f'{validators[0].hex}-0'
+    username = hashlib.md5(current_user.username.encode()).hexdigest()[:8]
+    return f'{validators[0].hex}-{current_user.pk}-{username}'
+
+
+def goods_detail_last_modified(request, pk, *args, **kwargs):
+    """商品详情页的最后修改时间
+
+    只用于访客：最后修改时间与当前用户无关，登陆用户的页面（头部）变化时只能由 ETag 判断。
+    """
+
+    if get_current_user(request) is not None:
+        return None
+    validators = _goods_validators(request, pk)
+    return validators[1] if validators else None
+
+
 class GoodsDetailView(generic.DetailView, BasicUserView):
     """商品详情视图"""
 
     model = Goods
     template_name = 'shop/goods_detail.html'
+    queryset = Goods.objects \
+        .select_related('seller') \
+        .only('goods_name', 'price', 'image', 'description', 'seller__username') \
+        .prefetch_related('image_variants')
+
+    @method_decorator(condition(etag_func=goods_detail_etag, last_modified_func=goods_detail_last_modified))
+    def get(self, request, *args, **kwargs):
+        # 客户端缓存仍然有效时直接返回 304 ，不查询商品详情，也不渲染模板
+        return super().get(request, *args, **kwargs)
 
     def get_context_data(self, *, object_list=None, **kwargs):
         # 添加用户对象到 context
@@ -205,34 +406,47 @@ class RegisterView(generic.FormView):
 
         response_form = RegisterFEForm(dict(username=username, email=email))
         format_error_info = '注册信息格式错误'
+        busy_error_info = '服务器繁忙，请稍后再试'
+        throttled_error_info = '请求过于频繁，请稍后再试'
 
         if not RegisterBEForm(request.POST).is_valid():
             # 表单格式错误
             for field in response_form.fields:
                 response_form.add_error(field, format_error_info)
-        elif User.objects.filter(username=username):
-            # 该用户名已被使用
-            response_form.add_error('username', '该用户名已被使用')
-        elif User.objects.filter(email=email):
-            # 该邮箱已被使用
-            response_form.add_error('email', '该邮箱已被使用')
         elif password1 != password2:
             # 两次输入的密码不一致
             error_info = '两次输入的密码不一致'
             response_form.add_error('password', error_info)
             response_form.add_error('password_again', error_info)
         else:
-            # 尝试新增用户
+            # 直接插入新用户，用户名或邮箱是否已被使用由数据库的唯一约束判断，不预先查询
             try:
                 user = User(username=username, email=email, password=password1)
-                user.save()
+                with password_check(request, username), transaction.atomic():
+                    user.save(force_insert=True)
                 associate_user_to_client(request, user.id)
 
                 return redirect_to_index()
-            except IntegrityError:
-                # 新增用户到数据库失败
+            except IntegrityError as e:
+                field = unique_error_field(User, e)
+                if field == 'username':
+                    # 该用户名已被使用
+                    response_form.add_error('username', '该用户名已被使用')
+                elif field == 'email':
+                    # 该邮箱已被使用
+                    response_form.add_error('email', '该邮箱已被使用')
+                else:
+                    # 新增用户到数据库失败
+                    for field in response_form.fields:
+                        response_form.add_error(field, format_error_info)
+            except Throttled:
+                # 请求过于频繁
+                for field in response_form.fields:
+                    response_form.add_error(field, throttled_error_info)
+            except PasswordHasherBusy:
+                # 密码哈希服务繁忙
                 for field in response_form.fields:
-                    response_form.add_error(field, format_error_info)
+                    response_form.add_error(field, busy_error_info)
 
         return self.form_invalid(response_form)
 
@@ -262,9 +476,11 @@ class LoginView(generic.FormView):
         else:
             # 尝试登陆，检查用户名和密码
             try:
-                user = User.objects.get(username=username)
-                if not user.check_password(password):
-                    raise User.DoesNotExist()
+                # 不存在的用户名同样计入限流，避免以此探测用户名
+                with password_check(request, username):
+                    user = User.objects.get(username=username)
+                    if not user.check_password(password):
+                        raise User.DoesNotExist()
 
                 associate_user_to_client(request, user.id)
 
@@ -275,6 +491,14 @@ class LoginView(generic.FormView):
                 error_info = '用户名或密码错误'
                 response_form.add_error('username', error_info)
                 response_form.add_error('password', error_info)
+            except Throttled:
+                # 请求过于频繁
+                for field in response_form.fields:
+                    response_form.add_error(field, '请求过于频繁，请稍后再试')
+            except PasswordHasherBusy:
+                # 密码哈希服务繁忙
+                for field in response_form.fields:
+                    response_form.add_error(field, '服务器繁忙，请稍后再试')
 
         return self.form_invalid(response_form)
 
@@ -339,11 +563,11 @@ def center_enter_view(request):
 
     # 判断用户类型并跳转到合适的用户中心
     if user is not None:
-        if user.type == UserType.objects.get(typename='normal'):
+        if user.type_id == get_usertype_id('normal'):
             center_url = reverse('shop:member_info')
-        elif user.typp == UserType.objects.get(typename='seller'):
+        elif user.type_id == get_usertype_id('seller'):
             center_url = reverse('shop:member_info')
-        elif user.type == UserType.objects.get(typename='admin'):
+        elif user.type_id == get_usertype_id('admin'):
             center_url = reverse('shop:member_info')
 
     if center_url is not None:
@@ -363,14 +587,20 @@ class APIView(generic.View):
     # TODO: 缺少APIView的基本测试
 
     api_method_names = ['pull', 'create', 'update', 'delete']
+    # 允许访问的用户类型，格式同 user_auth 的 usertype 参数
+    allowed_usertypes = ['normal', 'seller', 'admin']
+    # 操作中是否校验密码，校验密码的操作不能在事务中执行（见 throttling.password_check）
+    checks_password = False
 
     def __int__(self):
         self.result_builder = None
         super().__init__()
 
-    @user_auth(usertype=['normal', 'seller', 'admin'], error_viewname='shop:api_unauthorized_error')
-    @csrf_exempt
     def dispatch(self, request, *args, **kwargs):
+        auth = user_auth(usertype=self.allowed_usertypes, error_viewname='shop:api_unauthorized_error')
+        return auth(APIView._dispatch)(self, request, *args, **kwargs)
+
+    def _dispatch(self, request, *args, **kwargs):
         try:
             setattr(self, 'result_builder', APIResultBuilder())
             return super().dispatch(request, *args, **kwargs)
@@ -427,19 +657,118 @@ class APIView(generic.View):
 class UnauthorizedErrorApiView(APIView):
     """未经授权错误API"""
 
+    result = PreencodedResult(errors='No access for unauthorized.', status=403)
+
     def get(self, request, *args, **kwargs):
-        return self.result_builder \
-            .set_errors('No access for unauthorized.') \
-            .as_json_response(status=403)
+        return self.result.as_json_response()
 
 
 class ServerErrorApiView(APIView):
     """内部服务错误API"""
 
+    result = PreencodedResult(errors='Internal server error.', status=500)
+
     def get(self, request, *args, **kwargs):
-        return self.result_builder \
-            .set_errors('Internal server error.') \
-            .as_json_response(status=500)
+        return self.result.as_json_response()
+
+
+class GoodsAPIView(APIView):
+    """商品目录API
+
+    GET 或 pull 均可获取商品列表，参数：
+        - fields: 以逗号分隔的字段名，见 api_fields ，默认为 default_fields 。
+        - g, s, min_price, max_price, sort: 检索、过滤和排序，同商品列表页。
+        - c: 上一次返回的 next 游标。
+        - limit: 每页的商品数量，最大为 max_page_size 。
+
+    响应以流的形式发送，商品从数据库中分批取出并逐个编码，即使一页很大也不会在内存中构造完整的响应。
+    """
+
+    allowed_usertypes = [None, 'normal', 'seller', 'admin']
+    # 对外的字段名及其对应的查询字段
+    api_fields = {
+        'id': 'id',
+        'goods_name': 'goods_name',
+        'price': 'price',
+        'description': 'description',
+        'image': 'image',
+        'seller_id': 'seller_id',
+        'seller_name': 'seller__username',
+        'updated_at': 'updated_at',
+    }
+    default_fields = ('id', 'goods_name', 'price', 'image', 'seller_id', 'seller_name')
+    page_size = 20
+    max_page_size = 1000
+    # 每次从数据库游标中取出的行数
+    chunk_size = 200
+
+    def get(self, request, *args, **kwargs):
+        return self.pull(request, *args, **kwargs)
+
+    def pull(self, request, *args, **kwargs):
+        params = request.GET if request.method == 'GET' else request.POST
+
+        try:
+            fields = self.get_fields(params)
+            limit = int(params.get('limit', self.page_size))
+            if not 0 < limit <= self.max_page_size:
+                raise ValueError(limit)
+            queryset = self.get_queryset(params)
+            paginator = CursorPaginator(queryset, self.get_ordering(params), limit)
+            # 游标的值在开始发送响应之前校验并加入查询条件，格式错误时返回错误结果而不是中断响应
+            page = paginator.page(params.get('c'))
+            if page.reverse:
+                raise InvalidCursor(params['c'])
+            if page.values is not None:
+                queryset = queryset.filter(paginator.keyset_filter(page.values))
+        except (ValueError, InvalidCursor):
+            return self.result_builder \
+                .set_errors('Parameters format not correct error.') \
+                .as_json_response(412)
+
+        return self.result_builder.as_streaming_json_response(self.iter_results(page, queryset, fields))
+
+    def get_fields(self, params):
+        if not params.get('fields'):
+            return list(self.default_fields)
+
+        fields = [f.strip() for f in params['fields'].split(',') if f.strip()]
+        if not fields or any(f not in self.api_fields for f in fields):
+            raise ValueError(params['fields'])
+        return list(dict.fromkeys(fields))
+
+    def get_queryset(self, params):
+        return filter_goods(Goods.objects.all(), params)
+
+    def get_ordering(self, params):
+        return get_goods_ordering(params)
+
+    def iter_results(self, page, queryset, fields):
+        """逐行生成商品数据，结束后设置下一页的游标"""
+
+        paginator = page.paginator
+        columns = [self.api_fields[f] for f in fields]
+        key_count = len(paginator.fields)
+        rows = queryset \
+            .order_by(*paginator.ordering) \
+            .values_list(*columns, *paginator.fields)[:paginator.per_page + 1] \
+            .iterator(chunk_size=self.chunk_size)
+
+        image_storage = Goods._meta.get_field('image').storage
+        last_key = None
+        for i, row in enumerate(rows):
+            if i == paginator.per_page:
+                # 多取的一行说明还有下一页
+                self.result_builder.set_next(encode_cursor(last_key, ordering=paginator.ordering))
+                break
+
+            result = dict(zip(fields, row[:-key_count]))
+            if 'image' in result:
+                result['image'] = image_storage.url(result['image']) if result['image'] else None
+            last_key = list(row[-key_count:])
+            yield result
+        else:
+            self.result_builder.set_next(None)
 
 
 class UserEmailAPIView(APIView):
@@ -457,7 +786,15 @@ class UserEmailAPIView(APIView):
 
         if user.email == curr_email:
             user.email = new_email
-            user.save()
+            try:
+                with transaction.atomic():
+                    user.save()
+            except IntegrityError:
+                # 新邮箱已被其他用户使用（邮箱不区分大小写地唯一）
+                user.email = curr_email
+                return self.result_builder \
+                    .set_errors('The new user-email is already in use.') \
+                    .as_json_response(412)
 
             return self.result_builder \
                 .set_results('User-email changed successful.') \
@@ -471,6 +808,8 @@ class UserEmailAPIView(APIView):
 class UserPasswordAPIView(APIView):
     """用户密码API"""
 
+    checks_password = True
+
     def update(self, request, *args, **kwargs):
         if not ChangePasswordBEForm(request.POST).is_valid():
             return self.result_builder \
@@ -486,14 +825,138 @@ class UserPasswordAPIView(APIView):
             return self.result_builder \
                 .set_errors('Two new passwords do not match.') \
                 .as_json_response(412)
-        elif user.check_password(curr_password):
-            user.password = new_password
-            user.save()
 
+        try:
+            with password_check(request, user.username):
+                checked = user.check_password(curr_password)
+                if checked:
+                    user.password = new_password
+                    user.save()
+
+            if checked:
+                return self.result_builder \
+                    .set_results('User-password changed successful.') \
+                    .as_json_response()
+            else:
+                return self.result_builder \
+                    .set_errors('The current user-password is incorrect.') \
+                    .as_json_response(412)
+        except Throttled:
             return self.result_builder \
-                .set_results('User-password changed successful.') \
-                .as_json_response()
-        else:
+                .set_errors('Too many requests, please try again later.') \
+                .as_json_response(429)
+        except PasswordHasherBusy:
+            return self.result_builder \
+                .set_errors('Server is busy, please try again later.') \
+                .as_json_response(503)
+
+
+class BatchAPIView(APIView):
+    """批量操作API
+
+    在一个请求中按顺序执行多个API操作，减少客户端的往返次数。参数：
+        - operations: JSON 格式的操作列表，每个操作为 {"api": API的路径, "_ext_method": 方法, "params": 参数} 。
+        - atomic: 为“1”时所有操作在同一个事务中执行，任一操作失败则全部回滚，并不再执行后续操作。
+          校验密码的操作（如修改密码）不能在事务中执行，包含这类操作时返回 412 。
+
+    当前用户只在批量请求中解析一次，各操作按其API视图的 allowed_usertypes 分别授权。
+    返回的 results 为各操作的结果，格式与单独调用API时相同。
+    """
+
+    allowed_usertypes = [None, 'normal', 'seller', 'admin']
+    max_operations = 20
+
+    def post(self, request, *args, **kwargs):
+        """批量请求不需要指定 _ext_method"""
+
+        try:
+            operations = get_serializer().loads(request.POST.get('operations', ''))
+            if not isinstance(operations, list) or not 0 < len(operations) <= self.max_operations:
+                raise ValueError(operations)
+            for operation in operations:
+                if not isinstance(operation, dict) \
+                        or not isinstance(operation.get('api'), str) \
+                        or not isinstance(operation.get('_ext_method'), str) \
+                        or not isinstance(operation.get('params', {}), dict):
+                    raise ValueError(operation)
+        except ValueError:
             return self.result_builder \
-                .set_errors('The current user-password is incorrect.') \
+                .set_errors('Parameters format not correct error.') \
                 .as_json_response(412)
+
+        if request.POST.get('atomic') != '1':
+            results = [self.run_operation(request, operation) for operation in operations]
+            return self.result_builder \
+                .set_results(results) \
+                .as_json_response()
+
+        for operation in operations:
+            view_class = self.resolve_operation(operation)[1]
+            if getattr(view_class, 'checks_password', False):
+                return self.result_builder \
+                    .set_errors('Password operations cannot run in an atomic batch.') \
+                    .as_json_response(412)
+
+        results = []
+        with transaction.atomic():
+            for operation in operations:
+                result = self.run_operation(request, operation)
+                results.append(result)
+                if result['status'] != 200:
+                    transaction.set_rollback(True)
+                    return self.result_builder \
+                        .set_results(results) \
+                        .set_errors('Operation failed, all operations have been rolled back.') \
+                        .as_json_response(412)
+
+        return self.result_builder \
+            .set_results(results) \
+            .as_json_response()
+
+    @staticmethod
+    def resolve_operation(operation):
+        """返回操作对应的 URL 匹配结果和API视图类，不存在时视图类为 None"""
+
+        try:
+            match = resolve(operation['api'])
+        except Http404:
+            return None, None
+        return match, getattr(match.func, 'view_class', None)
+
+    def run_operation(self, request, operation):
+        """执行单个操作，返回其结果"""
+
+        match, view_class = self.resolve_operation(operation)
+        if view_class is None or not issubclass(view_class, APIView) or issubclass(view_class, BatchAPIView) \
+                or operation['_ext_method'] not in view_class.api_method_names:
+            return {'errors': 'Failure to match the appropriate method.', 'status': 405}
+
+        if not is_authorized(request, view_class.allowed_usertypes):
+            return {'errors': 'No access for unauthorized.', 'status': 403}
+
+        # 子请求共用当前请求的会话和当前用户
+        sub_request = copy.copy(request)
+        sub_request.path = sub_request.path_info = operation['api']
+        sub_request.GET = QueryDict()
+        sub_request.POST = QueryDict(mutable=True)
+        for key, value in operation.get('params', {}).items():
+            if isinstance(value, list):
+                sub_request.POST.setlist(key, [str(v) for v in value])
+            else:
+                sub_request.POST[key] = str(value)
+        sub_request.POST['_ext_method'] = operation['_ext_method']
+
+        view = view_class()
+        view.setup(sub_request, *match.args, **match.kwargs)
+        view.result_builder = APIResultBuilder()
+        # 校验密码的操作不在事务中执行
+        atomic = contextlib.nullcontext() if view_class.checks_password else transaction.atomic()
+        try:
+            with atomic:
+                handler = getattr(view, operation['_ext_method'])
+                response = handler(sub_request, *match.args, **match.kwargs)
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                return get_serializer().loads(content)
+        except Exception:
+            logger.exception('Batch operation failed: %s', operation['api'])
+            return {'errors': 'Internal server error.', 'status': 500}